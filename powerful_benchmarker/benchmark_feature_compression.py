@@ -0,0 +1,101 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import h5py
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, ".")
+from powerful_benchmarker.utils.feature_writer import (
+    COMPRESSION_CHOICES,
+    write_nested_dict,
+)
+
+
+def read_inference_dict(features_file, epoch):
+    with h5py.File(features_file, "r") as hf:
+        epoch = epoch if epoch is not None else list(hf.keys())[0]
+        grp = hf[f"{epoch}/inference"]
+        return {k1: {k2: v2[()] for k2, v2 in grp[k1].items()} for k1 in grp.keys()}
+
+
+def random_inference_dict(num_samples, feature_size, num_classes):
+    rng = np.random.default_rng(0)
+    output = {}
+    for split in ["src_train", "src_val", "target_train", "target_val"]:
+        features = rng.standard_normal((num_samples, feature_size), dtype=np.float32)
+        output[split] = {
+            "features": np.maximum(features, 0),
+            "logits": rng.standard_normal((num_samples, num_classes), dtype=np.float32),
+            "labels": rng.integers(0, num_classes, num_samples),
+        }
+    return output
+
+
+def read_all(filepath):
+    with h5py.File(filepath, "r") as hf:
+        hf.visititems(lambda _, obj: obj[()] if isinstance(obj, h5py.Dataset) else None)
+
+
+def benchmark(inference_dict, compression, folder, repeats):
+    num_bytes = sum(v2.nbytes for v1 in inference_dict.values() for v2 in v1.values())
+    filepath = os.path.join(folder, f"{compression}.hdf5")
+    write_times, read_times = [], []
+    for _ in range(repeats):
+        if os.path.isfile(filepath):
+            os.remove(filepath)
+        s = time.perf_counter()
+        with h5py.File(filepath, "w") as hf:
+            write_nested_dict(hf, inference_dict, 1, "inference", compression)
+        write_times.append(time.perf_counter() - s)
+        s = time.perf_counter()
+        read_all(filepath)
+        read_times.append(time.perf_counter() - s)
+    mb = num_bytes / 1e6
+    return {
+        "compression": compression,
+        "write_MB/s": mb / np.median(write_times),
+        "read_MB/s": mb / np.median(read_times),
+        "ratio": num_bytes / os.path.getsize(filepath),
+        "file_MB": os.path.getsize(filepath) / 1e6,
+    }
+
+
+def main(args):
+    if args.features_file:
+        inference_dict = read_inference_dict(args.features_file, args.epoch)
+    else:
+        inference_dict = random_inference_dict(
+            args.num_samples, args.feature_size, args.num_classes
+        )
+    for k1, v1 in inference_dict.items():
+        print(k1, {k2: (v2.shape, str(v2.dtype)) for k2, v2 in v1.items()})
+
+    results = []
+    with tempfile.TemporaryDirectory() as folder:
+        for compression in args.compressions:
+            try:
+                results.append(
+                    benchmark(inference_dict, compression, folder, args.repeats)
+                )
+            except ImportError as e:
+                print(f"skipping {compression}: {e}")
+    print(pd.DataFrame(results).round(2).to_string(index=False))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+    parser.add_argument("--features_file", type=str, default=None)
+    parser.add_argument("--epoch", type=str, default=None)
+    parser.add_argument("--num_samples", type=int, default=4000)
+    parser.add_argument("--feature_size", type=int, default=2048)
+    parser.add_argument("--num_classes", type=int, default=65)
+    parser.add_argument(
+        "--compressions", nargs="+", type=str, default=COMPRESSION_CHOICES
+    )
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    main(args)
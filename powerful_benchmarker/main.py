@@ -34,7 +34,7 @@ from pytorch_adapt.utils import common_functions as c_f
 
 sys.path.insert(0, ".")
 from powerful_benchmarker import configs
-from powerful_benchmarker.utils import ignite_save_features, main_utils
+from powerful_benchmarker.utils import feature_writer, ignite_save_features, main_utils
 from powerful_benchmarker.utils.constants import (
     BEST_TRIAL_FILENAME,
     TRIALS_FILENAME,
@@ -217,14 +217,17 @@ def objective(cfg, root_exp_path, trial, reproduce_iter=None, num_fixed_params=0
     if cfg.patience:
         early_stopper_kwargs = {"patience": cfg.patience}
 
-    best_score, best_epoch = adapter.run(
-        datasets=datasets,
-        dataloader_creator=dataloader_creator,
-        max_epochs=cfg.max_epochs,
-        early_stopper_kwargs=early_stopper_kwargs,
-        val_interval=cfg.val_interval,
-        check_initial_score=cfg.check_initial_score,
-    )
+    try:
+        best_score, best_epoch = adapter.run(
+            datasets=datasets,
+            dataloader_creator=dataloader_creator,
+            max_epochs=cfg.max_epochs,
+            early_stopper_kwargs=early_stopper_kwargs,
+            val_interval=cfg.val_interval,
+            check_initial_score=cfg.check_initial_score,
+        )
+    finally:
+        main_utils.close_val_hooks(val_hooks)
 
     if validator is None:
         if not ignite_utils.is_done(adapter.trainer, cfg.max_epochs):
@@ -350,6 +353,19 @@ if __name__ == "__main__":
     parser.add_argument("--pretrain_lr", type=float, default=0.01)
     parser.add_argument("--fixed_param_source", type=str, default=None)
     parser.add_argument("--save_features", action="store_true")
+    parser.add_argument("--async_save_features", action="store_true")
+    parser.add_argument(
+        "--feature_compression",
+        type=str,
+        default="gzip",
+        choices=feature_writer.COMPRESSION_CHOICES,
+    )
+    parser.add_argument(
+        "--feature_dtype",
+        type=str,
+        default="float32",
+        choices=feature_writer.FEATURE_DTYPE_CHOICES,
+    )
     parser.add_argument("--download_datasets", action="store_true")
     parser.add_argument("--use_stat_getter", action="store_true")
     parser.add_argument("--check_initial_score", action="store_true")
@@ -0,0 +1,250 @@
+import logging
+import multiprocessing
+import pickle
+import queue
+import sys
+import traceback
+
+import h5py
+import numpy as np
+
+COMPRESSION_CHOICES = ["gzip", "lzf", "none", "blosc_lz4", "blosc_zstd"]
+FEATURE_DTYPE_CHOICES = ["float32", "float16"]
+
+# Datasets with these names don't change between epochs of a trial.
+# They are written once, and later epochs soft link to the first copy,
+# which is marked with the EPOCH_INVARIANT_ATTR attribute.
+EPOCH_INVARIANT_KEYS = ["labels"]
+EPOCH_INVARIANT_ATTR = "epoch_invariant"
+
+# chunks are at most this big. Smaller arrays are stored in one chunk,
+# because features are always read in full.
+MAX_CHUNK_BYTES = 64 * 1024 * 1024
+
+LOGGER = logging.getLogger(__name__)
+
+
+def get_compression_kwargs(compression):
+    if compression == "none":
+        return {}
+    if compression in ["gzip", "lzf"]:
+        return {"compression": compression}
+    if compression in ["blosc_lz4", "blosc_zstd"]:
+        # optional dependency that registers the blosc filter with h5py
+        import hdf5plugin
+
+        cname = compression.split("_")[1]
+        return dict(hdf5plugin.Blosc(cname=cname, shuffle=hdf5plugin.Blosc.SHUFFLE))
+    raise ValueError(f"compression must be one of {COMPRESSION_CHOICES}")
+
+
+def get_chunks(shape, itemsize):
+    if len(shape) == 0 or 0 in shape:
+        return None
+    row_bytes = itemsize * int(np.prod(shape[1:]))
+    num_rows = max(1, min(shape[0], MAX_CHUNK_BYTES // max(row_bytes, 1)))
+    return (num_rows, *shape[1:])
+
+
+# Float arrays are cast to dtype.
+# If dtype is float16, integer arrays (e.g. labels) are also cast
+# to the smallest signed integer type that holds their values.
+def convert_dtype(x, dtype):
+    if np.issubdtype(x.dtype, np.floating):
+        return x.astype(dtype, copy=False)
+    if dtype == "float16" and np.issubdtype(x.dtype, np.integer) and x.size > 0:
+        for int_dtype in [np.int8, np.int16, np.int32]:
+            info = np.iinfo(int_dtype)
+            if x.min() >= info.min and x.max() <= info.max:
+                return x.astype(int_dtype)
+    return x
+
+
+# invariant is a dict that persists across calls.
+# It maps each epoch invariant dataset to the path and value of its first copy.
+# If None, every dataset is written in full.
+def write_nested_dict(hf, d, epoch, series_name, compression="gzip", invariant=None):
+    for k1, v1 in d.items():
+        grp = hf.create_group(f"{epoch}/{series_name}/{k1}")
+        for k2, v2 in v1.items():
+            kwargs = {}
+            if isinstance(v2, (np.ndarray, list)):
+                v2 = np.asarray(v2)
+                kwargs = get_compression_kwargs(compression)
+                if kwargs:
+                    kwargs["chunks"] = get_chunks(v2.shape, v2.dtype.itemsize)
+            is_invariant = invariant is not None and k2 in EPOCH_INVARIANT_KEYS
+            name = f"{series_name}/{k1}/{k2}"
+            if is_invariant and name in invariant:
+                path, first = invariant[name]
+                if first.dtype == v2.dtype and np.array_equal(first, v2):
+                    grp[k2] = h5py.SoftLink(path)
+                    continue
+            ds = grp.create_dataset(k2, data=v2, **kwargs)
+            if is_invariant and name not in invariant:
+                ds.attrs[EPOCH_INVARIANT_ATTR] = True
+                invariant[name] = (ds.name, np.array(v2))
+
+
+class FeatureWriter:
+    """
+    Writes nested dicts to an hdf5 file, keeping the file open
+    from the first write until close() is called.
+    Epoch invariant datasets (e.g. labels) are only written in full once.
+    """
+
+    def __init__(self, filepath, compression="gzip"):
+        self.filepath = filepath
+        self.compression = compression
+        self.hf = None
+        self.invariant = {}
+
+    def write(self, d, epoch, series_name):
+        if self.hf is None:
+            self.hf = h5py.File(self.filepath, "a")
+        write_nested_dict(
+            self.hf, d, epoch, series_name, self.compression, self.invariant
+        )
+        self.hf.flush()
+
+    def flush(self):
+        if self.hf is not None:
+            self.hf.flush()
+
+    def close(self):
+        if self.hf is not None:
+            self.hf.close()
+            self.hf = None
+
+
+def feature_writer_process(filepath, compression, tasks, replies, errors):
+    writer = FeatureWriter(filepath, compression)
+    failed = False
+    while True:
+        x = tasks.get()
+        if x in ["flush", None]:
+            if not failed:
+                writer.flush()
+            replies.put(failed)
+            if x is None:
+                break
+            continue
+        if failed:
+            continue
+        try:
+            writer.write(*pickle.loads(x))
+        except Exception:
+            failed = True
+            errors.put(traceback.format_exc())
+    writer.close()
+
+
+class AsyncFeatureWriter:
+    """
+    Same interface as FeatureWriter, but the compression and writing
+    is done in a separate process, so that training doesn't wait for it.
+    At most max_queue_size writes can be pending at once.
+    flush() and close() block until all pending writes are done,
+    and raise an error if any of the writes failed.
+    If close() is called while another exception is propagating,
+    the write error is logged instead, so that it doesn't replace that exception.
+    """
+
+    def __init__(self, filepath, compression="gzip", max_queue_size=4, timeout=1):
+        self.filepath = filepath
+        self.compression = compression
+        self.max_queue_size = max_queue_size
+        self.timeout = timeout
+        self.process = None
+        self.error = None
+
+    def start(self):
+        # spawn, because forking after CUDA has been initialized is unsafe.
+        # The child process only imports this module, which uses h5py and numpy.
+        ctx = multiprocessing.get_context("spawn")
+        self.tasks = ctx.Queue(maxsize=self.max_queue_size)
+        self.replies = ctx.Queue()
+        self.errors = ctx.Queue()
+        self.process = ctx.Process(
+            target=feature_writer_process,
+            args=(
+                self.filepath,
+                self.compression,
+                self.tasks,
+                self.replies,
+                self.errors,
+            ),
+            daemon=True,
+        )
+        self.process.start()
+
+    def write(self, d, epoch, series_name):
+        self.check_errors()
+        if self.process is None:
+            self.start()
+        # pickle now, because the arrays might be modified
+        # before the queue's feeder thread gets to them
+        self.put(pickle.dumps((d, epoch, series_name), pickle.HIGHEST_PROTOCOL))
+
+    def flush(self):
+        if self.process is not None:
+            self.put("flush")
+            self.wait_for_reply()
+
+    def close(self):
+        if self.process is None:
+            return
+        in_flight = sys.exc_info()[0] is not None
+        try:
+            self.put(None)
+            self.wait_for_reply()
+        except Exception:
+            if not in_flight:
+                raise
+            LOGGER.error(traceback.format_exc())
+        finally:
+            self.process.join()
+            self.process = None
+
+    def put(self, x):
+        while True:
+            try:
+                self.tasks.put(x, timeout=self.timeout)
+                return
+            except queue.Full:
+                self.check_alive()
+
+    def wait_for_reply(self):
+        while True:
+            try:
+                failed = self.replies.get(timeout=self.timeout)
+                break
+            except queue.Empty:
+                self.check_alive()
+        if failed:
+            self.check_errors(block=True)
+
+    def check_alive(self):
+        if not self.process.is_alive():
+            self.check_errors()
+            raise RuntimeError(
+                f"The feature writer process for {self.filepath} exited unexpectedly"
+            )
+
+    def check_errors(self, block=False):
+        if self.process is None:
+            return
+        if self.error is None:
+            try:
+                self.error = self.errors.get(block=block, timeout=self.timeout)
+            except queue.Empty:
+                return
+        raise RuntimeError(f"Failed to write to {self.filepath}\n{self.error}")
+
+
+def get_feature_writer(filepath, async_write=False, compression="gzip"):
+    # fail now, instead of when the first epoch is written
+    get_compression_kwargs(compression)
+    if async_write:
+        return AsyncFeatureWriter(filepath, compression)
+    return FeatureWriter(filepath, compression)
@@ -1,15 +1,26 @@
 import os
 
-import h5py
-import numpy as np
 from pytorch_adapt.utils import common_functions as c_f
 
+from .feature_writer import convert_dtype, get_feature_writer
+
 
 class SaveFeatures:
-    def __init__(self, folder, logger):
+    def __init__(
+        self,
+        folder,
+        logger,
+        async_write=False,
+        compression="gzip",
+        dtype="float32",
+    ):
         self.folder = os.path.join(folder, "features")
         c_f.makedir_if_not_there(self.folder)
         self.logger = logger
+        self.dtype = dtype
+        self.writer = get_feature_writer(
+            os.path.join(self.folder, "features.hdf5"), async_write, compression
+        )
         self.required_data = [
             "src_train",
             "src_val",
@@ -25,16 +36,23 @@ class SaveFeatures:
         for k, v in collected_data.items():
             curr_k = k.replace("_with_labels", "")
             inference_dict[curr_k] = {
-                name: v[name].cpu().numpy()
+                name: self.to_numpy(v[name])
                 for name in v.keys()
                 if name not in discard_keys()
             }
 
         losses_dict = self.logger.get_losses()
 
-        with h5py.File(os.path.join(self.folder, "features.hdf5"), "a") as hf:
-            write_nested_dict(hf, inference_dict, epoch, "inference")
-            write_nested_dict(hf, losses_dict, epoch, "losses")
+        self.writer.write(inference_dict, epoch, "inference")
+        self.writer.write(losses_dict, epoch, "losses")
+
+    def to_numpy(self, x):
+        return convert_dtype(x.cpu().numpy(), self.dtype)
+
+    # must be called at the end of the trial,
+    # so that all pending writes are finished and the file is closed
+    def close(self):
+        self.writer.close()
 
 
 class SaveFeaturesATDOC(SaveFeatures):
@@ -46,30 +64,19 @@ class SaveFeaturesATDOC(SaveFeatures):
         super().__call__(epoch, **collected_data)
         atdoc_dict = {
             "target_train": {
-                "feat_memory": self.atdoc.labeler.feat_memory.cpu().numpy(),
-                "pred_memory": self.atdoc.labeler.pred_memory.cpu().numpy(),
+                "feat_memory": self.to_numpy(self.atdoc.labeler.feat_memory),
+                "pred_memory": self.to_numpy(self.atdoc.labeler.pred_memory),
             }
         }
-        with h5py.File(os.path.join(self.folder, "features.hdf5"), "a") as hf:
-            write_nested_dict(hf, atdoc_dict, epoch, "atdoc")
+        self.writer.write(atdoc_dict, epoch, "atdoc")
 
 
 def save_features_atdoc(atdoc):
-    def fn(folder, logger):
-        return SaveFeaturesATDOC(atdoc, folder=folder, logger=logger)
+    def fn(folder, logger, **kwargs):
+        return SaveFeaturesATDOC(atdoc, folder=folder, logger=logger, **kwargs)
 
     return fn
 
 
-def write_nested_dict(hf, d, epoch, series_name):
-    for k1, v1 in d.items():
-        grp = hf.create_group(f"{epoch}/{series_name}/{k1}")
-        for k2, v2 in v1.items():
-            kwargs = (
-                {"compression": "gzip"} if isinstance(v2, (np.ndarray, list)) else {}
-            )
-            grp.create_dataset(k2, data=v2, **kwargs)
-
-
 def discard_keys():
     return ["imgs", "domain", "preds"]
@@ -121,10 +121,24 @@ def get_val_hooks(cfg, folder, logger, num_classes, pretrain_on_src, save_featur
         stat_getter = get_stat_getter(num_classes, pretrain_on_src)
         hooks.append(IgniteValHookWrapper(stat_getter, logger=logger))
     if cfg.save_features:
-        hooks.append(save_features_cls(folder, logger))
+        hooks.append(
+            save_features_cls(
+                folder,
+                logger,
+                async_write=cfg.async_save_features,
+                compression=cfg.feature_compression,
+                dtype=cfg.feature_dtype,
+            )
+        )
     return hooks
 
 
+def close_val_hooks(hooks):
+    for h in hooks:
+        if hasattr(h, "close"):
+            h.close()
+
+
 def get_datasets(
     dataset,
     src_domains,
@@ -0,0 +1,33 @@
+import unittest
+
+import torch
+import torch.nn.functional as F
+from torchmetrics.functional import accuracy
+
+from validator_tests.configs import Accuracy, EpochCache
+
+
+class TestAccuracy(unittest.TestCase):
+    def test_accuracy(self):
+        torch.manual_seed(0)
+        logits = torch.randn(1000, 10)
+        # class 9 is never predicted or labeled,
+        # and class 8 is predicted but never labeled
+        logits[:, 9] = -100
+        labels = torch.randint(0, 8, (1000,))
+        x = {
+            "inference/src_val/logits": logits.numpy(),
+            "inference/src_val/labels": labels.numpy(),
+        }
+        exp_config = {"dataset": "mnist"}
+        device = torch.device("cpu")
+        cache = EpochCache(x)
+        for average in ["micro", "macro"]:
+            correct = accuracy(
+                F.softmax(logits, dim=1), labels, average=average, num_classes=10
+            ).item()
+            config = Accuracy({"average": average, "split": "src_val"})
+            self.assertAlmostEqual(config.score(x, exp_config, device), correct)
+            self.assertAlmostEqual(config.score(cache, exp_config, device), correct)
+        # the micro and macro configs share one confusion matrix
+        self.assertEqual(cache.hits, 1)
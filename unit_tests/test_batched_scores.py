@@ -0,0 +1,45 @@
+import unittest
+
+import numpy as np
+import torch
+
+from validator_tests.configs import BNM, FBNM, Accuracy, Diversity, Entropy, EpochCache
+from validator_tests.configs.base_config import BaseConfig
+from validator_tests.utils.stacked_features import StackedEpochs
+
+
+class TestBatchedScores(unittest.TestCase):
+    def test_batched_scores(self):
+        rng = np.random.default_rng(0)
+        data = {}
+        for epoch in ["1", "2", "3"]:
+            logits = rng.standard_normal((500, 10)).astype(np.float32)
+            # class 9 is never predicted or labeled,
+            # and class 8 is predicted but never labeled
+            logits[:, 9] = -100
+            data[epoch] = {
+                "inference/src_val/logits": logits,
+                "inference/src_val/labels": rng.integers(0, 8, 500),
+            }
+        exp_config = {"dataset": "mnist"}
+        device = torch.device("cpu")
+        validators = [
+            Entropy({"split": "src_val"}),
+            Diversity({"split": "src_val"}),
+            Accuracy({"average": "micro", "split": "src_val"}),
+            Accuracy({"average": "macro", "split": "src_val"}),
+            BNM({"layer": "logits", "split": "src_val"}),
+            FBNM({"layer": "logits", "split": "src_val"}),
+        ]
+        x = EpochCache(StackedEpochs(data, list(data.keys())))
+        for validator in validators:
+            scores = validator.score_epochs(x, exp_config, device)
+            self.assertEqual(scores.shape, (len(data),))
+            for i, epoch in enumerate(data.keys()):
+                correct = validator.score(data[epoch], exp_config, device)
+                self.assertAlmostEqual(scores[i].item(), correct, places=5)
+            # the default implementation scores one epoch at a time
+            scores = BaseConfig.score_epochs(validator, x, exp_config, device)
+            for i, epoch in enumerate(data.keys()):
+                correct = validator.score(data[epoch], exp_config, device)
+                self.assertAlmostEqual(scores[i].item(), correct, places=5)
@@ -0,0 +1,57 @@
+import unittest
+
+import torch
+
+from validator_tests import main
+from validator_tests.configs import SND, EpochCache
+from validator_tests.utils import costs
+
+
+def get_costs_row(curr_costs, input_shapes):
+    return costs.get_costs_row(
+        "SND",
+        "{}",
+        curr_costs,
+        input_shapes,
+        {"dataset": "mnist"},
+        "exp_folder",
+        "1",
+        torch.device("cpu"),
+    )
+
+
+class TestCosts(unittest.TestCase):
+    def test_shared_work(self):
+        torch.manual_seed(0)
+        x = EpochCache(
+            {
+                "inference/target_train/features": torch.randn(2000, 64).numpy(),
+                "inference/target_train/logits": torch.randn(2000, 10).numpy(),
+            }
+        )
+        device = torch.device("cpu")
+        # like in main.py, all configs are created before scoring,
+        # so that the SND configs share their scores
+        validators = [
+            SND({"T": T, "layer": "features", "split": "target_train"})
+            for T in ["0.05", "0.1"]
+        ]
+        rows = []
+        for config in validators:
+            _, row = main.score_with_costs(
+                lambda y: config.score(y, None, device), x, True, get_costs_row
+            )
+            rows.append(row)
+        producer, consumer = rows
+        # the second config reuses the scores computed by the first one,
+        # but still records the inputs of that computation
+        for row in rows:
+            self.assertEqual(row["num_rows"], 2000)
+            self.assertEqual(row["num_dims"], 64)
+        self.assertEqual(producer["num_reused"], 0)
+        self.assertEqual(producer["reused_time"], 0)
+        self.assertTrue(0 < producer["shared_time"] <= producer["wall_time"])
+        self.assertEqual(consumer["num_reused"], 1)
+        self.assertEqual(consumer["shared_time"], 0)
+        self.assertAlmostEqual(consumer["reused_time"], producer["shared_time"])
+        self.assertTrue(consumer["wall_time"] < consumer["reused_time"])
@@ -0,0 +1,38 @@
+import unittest
+
+import torch
+
+from validator_tests.configs.dev_linear import LinearDEV
+
+
+def get_epoch(src_train, target_train, generator):
+    def noise(x):
+        return x + 0.1 * torch.randn(x.shape, generator=generator)
+
+    return {
+        "src_train": noise(src_train),
+        "target_train": noise(target_train),
+        "src_val": torch.randn(200, src_train.shape[1], generator=generator),
+        "logits": torch.randn(200, 10, generator=generator),
+        "labels": torch.randint(0, 10, (200,), generator=generator),
+    }
+
+
+class TestLinearDEV(unittest.TestCase):
+    def test_warm_start(self):
+        generator = torch.Generator().manual_seed(0)
+        src_train = torch.randn(500, 32, generator=generator)
+        target_train = torch.randn(400, 32, generator=generator) + 0.3
+        epochs = [get_epoch(src_train, target_train, generator) for _ in range(4)]
+        error_fn = torch.nn.CrossEntropyLoss(reduction="none")
+
+        def get_scores(warm_start, order):
+            validator = LinearDEV("lbfgs", error_fn, None, warm_start=warm_start)
+            return {i: validator(**epochs[i], key="trial").item() for i in order}
+
+        correct = get_scores(False, range(len(epochs)))
+        # scores don't depend on the order in which epochs are visited
+        for order in [[0, 1, 2, 3], [3, 1, 0, 2]]:
+            scores = get_scores(True, order)
+            for i in order:
+                self.assertTrue(abs(scores[i] - correct[i]) <= 1e-6 * abs(correct[i]))
@@ -0,0 +1,27 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from powerful_benchmarker.utils.feature_writer import AsyncFeatureWriter
+
+
+class TestFeatureWriter(unittest.TestCase):
+    def test_async_close_errors(self):
+        x = {"src_train": {"labels": np.arange(3)}}
+        for in_flight in [False, True]:
+            with tempfile.TemporaryDirectory() as folder:
+                writer = AsyncFeatureWriter(os.path.join(folder, "features.hdf5"))
+                writer.write(x, 1, "inference")
+                # writing the same epoch twice fails
+                writer.write(x, 1, "inference")
+                # the write error is only raised if nothing else is
+                expected = KeyError if in_flight else RuntimeError
+                with self.assertRaises(expected):
+                    try:
+                        if in_flight:
+                            raise KeyError
+                    finally:
+                        writer.close()
+                self.assertIsNone(writer.process)
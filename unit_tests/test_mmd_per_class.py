@@ -0,0 +1,80 @@
+import math
+import unittest
+
+import torch
+from pytorch_adapt.validators import MMDValidator, PerClassValidator
+
+from validator_tests.configs import EpochCache, MMDPerClass, MMDPerClassFixedB
+
+
+def get_data(src, target, src_labels, target_labels, num_classes):
+    return {
+        "inference/src_train/features": src.numpy(),
+        "inference/src_train/labels": src_labels.numpy(),
+        "inference/target_train/features": target.numpy(),
+        "inference/target_train/logits": torch.nn.functional.one_hot(
+            target_labels, num_classes
+        )
+        .float()
+        .numpy(),
+    }
+
+
+def get_correct(config, src, target, src_labels, target_labels):
+    validator = PerClassValidator(
+        MMDValidator(batch_size=512, mmd_kwargs=config.get_mmd_kwargs())
+    )
+    return validator(
+        src_train={"features": src, "labels": src_labels},
+        target_train={
+            "features": target,
+            "logits": torch.nn.functional.one_hot(target_labels, 12).float(),
+        },
+    )
+
+
+class TestMMDPerClass(unittest.TestCase):
+    def test_mmd_per_class(self):
+        torch.manual_seed(0)
+        src, target = torch.randn(600, 32), torch.randn(500, 32) + 0.1
+        # class 10 has only 1 src row, and class 11 is only in the target domain
+        src_labels = torch.cat([torch.randint(0, 10, (599,)), torch.tensor([10])])
+        target_labels = torch.randint(0, 12, (500,))
+        x = get_data(src, target, src_labels, target_labels, 12)
+        keep_src, keep_target = src_labels < 10, target_labels < 10
+        device = torch.device("cpu")
+        for config_class in [MMDPerClass, MMDPerClassFixedB]:
+            for exponent in ["0", "2"]:
+                config = config_class(
+                    {
+                        "exponent": exponent,
+                        "normalize": "0",
+                        "layer": "features",
+                        "split": "train",
+                    }
+                )
+                # class 10 is skipped, instead of making the score NaN
+                correct = get_correct(
+                    config,
+                    src[keep_src],
+                    target[keep_target],
+                    src_labels[keep_src],
+                    target_labels[keep_target],
+                )
+                self.assertTrue(
+                    math.isnan(
+                        get_correct(config, src, target, src_labels, target_labels)
+                    )
+                )
+                for curr_x in [x, EpochCache(x)]:
+                    score = config.score(curr_x, None, device)
+                    self.assertAlmostEqual(score, correct, places=5)
+
+    def test_all_degenerate(self):
+        src, target = torch.randn(2, 8), torch.randn(2, 8)
+        labels = torch.tensor([0, 1])
+        x = get_data(src, target, labels, labels, 2)
+        config = MMDPerClass(
+            {"exponent": "0", "normalize": "0", "layer": "features", "split": "train"}
+        )
+        self.assertTrue(math.isnan(config.score(x, None, torch.device("cpu"))))
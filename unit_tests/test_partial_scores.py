@@ -0,0 +1,35 @@
+import argparse
+import os
+import tempfile
+import unittest
+
+from validator_tests.scripts import delete_DEV_folders
+from validator_tests.utils import utils
+from validator_tests.utils.constants import VALIDATOR_TESTS_FOLDER
+
+
+class TestPartialScores(unittest.TestCase):
+    def test_delete_DEV_folders_keeps_partial_scores(self):
+        with tempfile.TemporaryDirectory() as exp_folder:
+            trial_folder = os.path.join(exp_folder, "group", "exp_name", "0")
+            validator_args_str = utils.dict_to_str({"layer": "features"})
+            utils.save_partial_score(
+                trial_folder, "DEV", validator_args_str, "1", {"score": 0.5}
+            )
+            dev_folder = os.path.join(
+                trial_folder, VALIDATOR_TESTS_FOLDER, "DEV_layer_features_1"
+            )
+            os.makedirs(dev_folder)
+
+            args = argparse.Namespace(
+                exp_folder=exp_folder,
+                exp_groups=["group"],
+                exp_names=["exp_name"],
+                delete=True,
+            )
+            delete_DEV_folders.main(args)
+            self.assertFalse(os.path.isdir(dev_folder))
+            self.assertEqual(
+                utils.load_partial_score(trial_folder, "DEV", validator_args_str, "1"),
+                {"score": 0.5},
+            )
@@ -0,0 +1,38 @@
+import unittest
+
+import torch
+from pytorch_adapt.validators import SNDValidator
+
+from validator_tests.configs import SND, EpochCache
+
+
+class TestSND(unittest.TestCase):
+    def test_snd(self):
+        torch.manual_seed(0)
+        features = torch.randn(1000, 64)
+        logits = torch.randn(1000, 10)
+        x = {
+            "inference/target_train/features": features.numpy(),
+            "inference/target_train/logits": logits.numpy(),
+        }
+        layers = {
+            "features": features,
+            "logits": logits,
+            "preds": torch.softmax(logits, dim=1),
+        }
+        device = torch.device("cpu")
+        self.addCleanup(setattr, SND, "batch_size", SND.batch_size)
+        for layer, embeddings in layers.items():
+            for T in [0.01, 0.05, 0.1, 0.5]:
+                correct = SNDValidator(layer=layer, T=T)(
+                    target_train={layer: embeddings}
+                )
+                config = SND({"T": str(T), "layer": layer, "split": "target_train"})
+                for batch_size in [1, 99, 1000, 2048]:
+                    SND.batch_size = batch_size
+                    self.assertAlmostEqual(
+                        config.score(x, None, device), correct, places=5
+                    )
+                    self.assertAlmostEqual(
+                        config.score(EpochCache(x), None, device), correct, places=5
+                    )
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+from powerful_benchmarker.utils.feature_writer import FeatureWriter
+from validator_tests import convert_features
+from validator_tests.utils import utils
+from validator_tests.utils.stacked_features import (
+    StackedEpochs,
+    StackedFeatures,
+    convert_to_stacked,
+)
+
+
+def write_epoch(features_file, epoch):
+    with h5py.File(features_file, "a") as hf:
+        hf[f"{epoch}/inference/src_train/logits"] = np.full((4, 3), epoch, np.float32)
+
+
+class TestStackedFeatures(unittest.TestCase):
+    def test_out_of_date(self):
+        with tempfile.TemporaryDirectory() as folder:
+            features_file = utils.get_features_filepath(folder)
+            os.makedirs(os.path.dirname(features_file))
+            for epoch in [1, 2]:
+                write_epoch(features_file, epoch)
+            convert_features.convert_folder(folder, overwrite=False)
+            with utils.open_features(folder) as data:
+                self.assertIsInstance(data, StackedFeatures)
+                self.assertEqual(list(data.keys()), ["1", "2"])
+
+            # e.g. converted while the trial was still training
+            write_epoch(features_file, 3)
+            with utils.open_features(folder) as data:
+                self.assertNotIsInstance(data, StackedFeatures)
+                self.assertEqual(list(data.keys()), ["1", "2", "3"])
+
+            convert_features.convert_folder(folder, overwrite=False)
+            with utils.open_features(folder) as data:
+                self.assertIsInstance(data, StackedFeatures)
+                self.assertEqual(list(data.keys()), ["1", "2", "3"])
+                np.testing.assert_array_equal(
+                    data["3"]["inference/src_train/logits"], 3
+                )
+
+    def test_invariant_labels(self):
+        with tempfile.TemporaryDirectory() as folder:
+            features_file = os.path.join(folder, "features.hdf5")
+            stacked_file = os.path.join(folder, "features_stacked.hdf5")
+            writer = FeatureWriter(features_file)
+            labels = np.arange(4)
+            for epoch in [1, 2, 3]:
+                x = {"logits": np.full((4, 3), epoch, np.float32), "labels": labels}
+                writer.write({"src_train": x}, epoch, "inference")
+            writer.close()
+            self.assertEqual(convert_to_stacked(features_file, stacked_file), [])
+
+            with h5py.File(stacked_file, "r") as hf:
+                self.assertEqual(hf["inference/src_train/labels"].shape, (4,))
+                self.assertEqual(hf["inference/src_train/logits"].shape, (3, 4, 3))
+            data = StackedFeatures(stacked_file)
+            np.testing.assert_array_equal(
+                data["2"]["inference/src_train/labels"], labels
+            )
+            x = StackedEpochs(data, ["1", "3"])
+            np.testing.assert_array_equal(
+                x["inference/src_train/labels"], np.stack([labels, labels])
+            )
+            np.testing.assert_array_equal(
+                x["inference/src_train/logits"][:, 0, 0], [1, 3]
+            )
@@ -0,0 +1,79 @@
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, ".")
+from powerful_benchmarker.utils.constants import add_default_args
+from validator_tests import configs, flags
+from validator_tests.utils import benchmark_utils, utils
+
+
+# Compares each exact KNN config of the features layer with its projected version,
+# for every proj_dim.
+def benchmark(x, exp_config, flag_names, proj_dims):
+    rows = []
+    for flag_name in flag_names:
+        for f in getattr(flags, flag_name)():
+            f = dict(f)
+            if f.get("layer", "features") != "features":
+                continue
+            validator_name = f.pop("validator")
+            exact, exact_time = benchmark_utils.timed_score(
+                getattr(configs, validator_name)(f), x, exp_config
+            )
+            for proj_dim in proj_dims:
+                approx_args = {**f, "proj_dim": str(proj_dim)}
+                approx, approx_time = benchmark_utils.timed_score(
+                    getattr(configs, f"{validator_name}Projected")(approx_args),
+                    x,
+                    exp_config,
+                )
+                rows.append(
+                    {
+                        "validator": validator_name,
+                        "validator_args": utils.dict_to_str(f),
+                        "proj_dim": proj_dim,
+                        "exact": exact,
+                        "approx": approx,
+                        "abs_error": abs(exact - approx),
+                        "speedup": exact_time / approx_time,
+                    }
+                )
+    return pd.DataFrame(rows)
+
+
+def main(args):
+    exp_folders = utils.get_exp_folders(
+        os.path.join(args.exp_folder, args.exp_group), args.exp_name
+    )
+    folder = exp_folders[args.trial_idx]
+    exp_config = utils.read_exp_config_file(folder)
+    with utils.open_features(folder) as data:
+        epoch = args.epoch if args.epoch is not None else list(data.keys())[-1]
+        x = utils.read_epoch_into_memory(data[epoch])
+    print(f"{folder}, epoch {epoch}")
+
+    df = benchmark(x, exp_config, args.flags, args.proj_dims)
+    with pd.option_context("display.max_colwidth", None):
+        print(df.to_string(index=False))
+    print(df.groupby("proj_dim")[["abs_error", "speedup"]].mean())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+    add_default_args(parser, ["exp_folder"])
+    parser.add_argument("--exp_group", type=str, required=True)
+    parser.add_argument("--exp_name", type=str, required=True)
+    parser.add_argument("--trial_idx", type=int, default=0)
+    parser.add_argument("--epoch", type=str, default=None)
+    parser.add_argument(
+        "--flags",
+        nargs="+",
+        type=str,
+        default=["KNN", "TargetKNN"],
+    )
+    parser.add_argument("--proj_dims", nargs="+", type=int, default=[32, 64, 128])
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,100 @@
+import argparse
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, ".")
+from powerful_benchmarker.utils.constants import add_default_args
+from validator_tests import configs, flags
+from validator_tests.utils import benchmark_utils, utils
+
+
+# Pairs each quadratic MMD config with its linear versions.
+def get_validators(flag_names, methods, num_features):
+    output = []
+    for flag_name in flag_names:
+        for f in getattr(flags, flag_name)():
+            f = dict(f)
+            validator_name = f.pop("validator")
+            quadratic = getattr(configs, validator_name)(f)
+            linear_name = validator_name.replace("MMD", "MMDLinear", 1)
+            for method in methods:
+                linear_args = {
+                    **f,
+                    "method": method,
+                    "num_features": str(num_features),
+                }
+                linear = getattr(configs, linear_name)(linear_args)
+                output.append((validator_name, f, method, quadratic, linear))
+    return output
+
+
+# Scores every checkpoint with each quadratic config and its linear versions.
+def get_scores(validators, exp_folders):
+    rows = []
+    for e in exp_folders:
+        print(e)
+        exp_config = utils.read_exp_config_file(e)
+        with utils.open_features(e) as data:
+            for epoch in data.keys():
+                x = utils.read_epoch_into_memory(data[epoch])
+                for validator_name, f, method, quadratic, linear in validators:
+                    score, quadratic_time = benchmark_utils.timed_score(
+                        quadratic, x, exp_config
+                    )
+                    score_linear, linear_time = benchmark_utils.timed_score(
+                        linear, x, exp_config
+                    )
+                    rows.append(
+                        {
+                            "validator": validator_name,
+                            "validator_args": utils.dict_to_str(f),
+                            "method": method,
+                            "exp_folder": e,
+                            "epoch": epoch,
+                            "score": score,
+                            "score_linear": score_linear,
+                            "quadratic_time": quadratic_time,
+                            "linear_time": linear_time,
+                        }
+                    )
+    return pd.DataFrame(rows)
+
+
+def get_speedup(x):
+    return {"speedup": x["quadratic_time"].sum() / x["linear_time"].sum()}
+
+
+def main(args):
+    exp_folders = benchmark_utils.get_trial_folders(
+        args.exp_folder, args.exp_group, args.exp_name, args.trial_range
+    )
+    validators = get_validators(args.flags, args.methods, args.num_features)
+
+    df = get_scores(validators, exp_folders)
+    summary = benchmark_utils.summarize_score_pairs(
+        df, "score_linear", ["validator", "validator_args", "method"], get_speedup
+    )
+    with pd.option_context("display.max_colwidth", None):
+        print(summary.to_string(index=False))
+    if args.output:
+        summary.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+    add_default_args(parser, ["exp_folder"])
+    parser.add_argument("--exp_group", type=str, required=True)
+    parser.add_argument("--exp_name", type=str, required=True)
+    parser.add_argument(
+        "--flags",
+        nargs="+",
+        type=str,
+        default=["MMD", "MMDFixedB", "MMDPerClass", "MMDPerClassFixedB"],
+    )
+    parser.add_argument("--methods", nargs="+", type=str, default=["rff", "nystrom"])
+    parser.add_argument("--num_features", type=int, default=1024)
+    parser.add_argument("--trial_range", nargs="+", type=int, default=[])
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,77 @@
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, ".")
+from powerful_benchmarker.utils.constants import add_default_args
+from validator_tests import configs, flags
+from validator_tests.utils import benchmark_utils, utils
+
+
+# Compares each exact ClassSS config with its sampled version,
+# for every sample_size. The clustering is seeded,
+# so both versions score the same clusters.
+def benchmark(x, exp_config, flag_names, sample_sizes):
+    rows = []
+    for flag_name in flag_names:
+        for f in getattr(flags, flag_name)():
+            f = dict(f)
+            validator_name = f.pop("validator")
+            exact, exact_time = benchmark_utils.timed_score(
+                getattr(configs, validator_name)(f), x, exp_config
+            )
+            for sample_size in sample_sizes:
+                sampled_args = {**f, "sample_size": str(sample_size)}
+                sampled, sampled_time = benchmark_utils.timed_score(
+                    getattr(configs, f"{validator_name}Sampled")(sampled_args),
+                    x,
+                    exp_config,
+                )
+                rows.append(
+                    {
+                        "validator": validator_name,
+                        "validator_args": utils.dict_to_str(f),
+                        "sample_size": sample_size,
+                        "exact": exact,
+                        "sampled": sampled,
+                        "abs_error": abs(exact - sampled),
+                        "speedup": exact_time / sampled_time,
+                    }
+                )
+    return pd.DataFrame(rows)
+
+
+def main(args):
+    exp_folders = utils.get_exp_folders(
+        os.path.join(args.exp_folder, args.exp_group), args.exp_name
+    )
+    folder = exp_folders[args.trial_idx]
+    exp_config = utils.read_exp_config_file(folder)
+    with utils.open_features(folder) as data:
+        epoch = args.epoch if args.epoch is not None else list(data.keys())[-1]
+        x = utils.read_epoch_into_memory(data[epoch])
+    print(f"{folder}, epoch {epoch}")
+
+    df = benchmark(x, exp_config, args.flags, args.sample_sizes)
+    with pd.option_context("display.max_colwidth", None):
+        print(df.to_string(index=False))
+    print(df.groupby("sample_size")[["abs_error", "speedup"]].agg(["mean", "max"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+    add_default_args(parser, ["exp_folder"])
+    parser.add_argument("--exp_group", type=str, required=True)
+    parser.add_argument("--exp_name", type=str, required=True)
+    parser.add_argument("--trial_idx", type=int, default=0)
+    parser.add_argument("--epoch", type=str, default=None)
+    parser.add_argument(
+        "--flags", nargs="+", type=str, default=["ClassSS", "ClassSSCentroidInit"]
+    )
+    parser.add_argument(
+        "--sample_sizes", nargs="+", type=int, default=[1000, 2000, 5000]
+    )
+    args = parser.parse_args()
+    main(args)
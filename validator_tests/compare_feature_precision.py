@@ -0,0 +1,81 @@
+import argparse
+import os
+import sys
+import tempfile
+
+import pandas as pd
+import torch
+
+sys.path.insert(0, ".")
+from powerful_benchmarker.utils.constants import add_default_args
+from powerful_benchmarker.utils.feature_writer import convert_dtype
+from validator_tests import configs
+from validator_tests.main import get_validators_from_flags
+from validator_tests.utils import benchmark_utils, utils
+
+DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+# Scores every checkpoint twice: once with the saved features,
+# and once with the features rounded to float16,
+# to check that saving with --feature_dtype float16 preserves the rankings.
+def get_scores(validators, exp_folders, dtype):
+    rows = []
+    with tempfile.TemporaryDirectory() as temp_folder:
+        for i, e in enumerate(exp_folders):
+            print(e)
+            exp_config = utils.read_exp_config_file(e)
+            with utils.open_features(e) as data:
+                for epoch in data.keys():
+                    x = utils.read_epoch_into_memory(data[epoch])
+                    x_low = {k: convert_dtype(v, dtype) for k, v in x.items()}
+                    x, x_low = configs.EpochCache(x), configs.EpochCache(x_low)
+                    for j, (name, args_str, validator) in enumerate(validators):
+                        if isinstance(validator, configs.DEV):
+                            validator.validator.temp_folder = os.path.join(
+                                temp_folder, f"{j}_{i}_{epoch}"
+                            )
+                        rows.append(
+                            {
+                                "validator": name,
+                                "validator_args": args_str,
+                                "exp_folder": e,
+                                "epoch": epoch,
+                                "score": validator.score(x, exp_config, DEVICE),
+                                "score_low": validator.score(x_low, exp_config, DEVICE),
+                            }
+                        )
+    return pd.DataFrame(rows)
+
+
+def main(args):
+    exp_folders = benchmark_utils.get_trial_folders(
+        args.exp_folder, args.exp_group, args.exp_name, args.trial_range
+    )
+    validators = []
+    for validator_name, validator_args in get_validators_from_flags(args.flags):
+        validator = getattr(configs, validator_name)(validator_args)
+        validator_args_str = utils.dict_to_str(validator.validator_args)
+        validators.append((validator_name, validator_args_str, validator))
+
+    df = get_scores(validators, exp_folders, args.dtype)
+    summary = benchmark_utils.summarize_score_pairs(
+        df, "score_low", ["validator", "validator_args"]
+    )
+    with pd.option_context("display.max_colwidth", None):
+        print(summary.to_string(index=False))
+    if args.output:
+        summary.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+    add_default_args(parser, ["exp_folder"])
+    parser.add_argument("--exp_group", type=str, required=True)
+    parser.add_argument("--exp_name", type=str, required=True)
+    parser.add_argument("--flags", nargs="+", type=str, required=True)
+    parser.add_argument("--trial_range", nargs="+", type=int, default=[])
+    parser.add_argument("--dtype", type=str, default="float16")
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+    main(args)
@@ -4,13 +4,31 @@ from .cluster_config import (
     ClassAMICentroidInit,
     ClassSS,
     ClassSSCentroidInit,
+    ClassSSCentroidInitSampled,
+    ClassSSSampled,
     DomainCluster,
 )
 from .d_logits_accuracy_config import DLogitsAccuracy
-from .dev_config import DEV, DEVBinary
+from .dev_config import DEV, DEVBinary, DEVLinear, DEVLinearBinary
 from .diversity_config import Diversity
 from .entropy_config import Entropy
-from .knn_config import KNN, TargetKNN, TargetKNNLogits
-from .mmd_config import MMD, MMDFixedB, MMDPerClass, MMDPerClassFixedB
+from .epoch_cache import EpochCache
+from .knn_config import (
+    KNN,
+    KNNProjected,
+    TargetKNN,
+    TargetKNNLogits,
+    TargetKNNProjected,
+)
+from .mmd_config import (
+    MMD,
+    MMDFixedB,
+    MMDLinear,
+    MMDLinearFixedB,
+    MMDLinearPerClass,
+    MMDLinearPerClassFixedB,
+    MMDPerClass,
+    MMDPerClassFixedB,
+)
 from .snd_config import SND
-from .svd_config import BNM, BSP, FBNM
+from .svd_config import BNM, BSP, FBNM, BNMApprox, BSPApprox
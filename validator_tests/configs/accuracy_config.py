@@ -1,32 +1,68 @@
-import torch.nn.functional as F
-from pytorch_adapt.validators import AccuracyValidator
+import torch
 
 from powerful_benchmarker.utils.main_utils import num_classes
 
 from .base_config import BaseConfig, get_from_hdf5
+from .epoch_cache import EpochCache
 
 
+# Confusion matrices of labels (rows) vs preds (columns), from a single bincount.
+# labels and preds can have leading batch dimensions, e.g. (epochs, N),
+# in which case one matrix is returned per batch element.
+def confusion_matrices(labels, preds, num_classes):
+    batch_shape = labels.shape[:-1]
+    labels, preds = labels.reshape(-1, labels.shape[-1]), preds.reshape(labels.shape)
+    offsets = torch.arange(len(labels), device=labels.device).unsqueeze(1)
+    idx = (offsets * num_classes + labels) * num_classes + preds
+    counts = torch.bincount(idx.flatten(), minlength=len(labels) * num_classes**2)
+    return counts.view(*batch_shape, num_classes, num_classes)
+
+
+# Accuracy of each class, i.e. recall. Classes without labels have an accuracy of 0.
+def per_class_accuracy(confusion):
+    tp = torch.diagonal(confusion, dim1=-2, dim2=-1).float()
+    return tp / confusion.sum(dim=-1).clamp(min=1)
+
+
+# Same as torchmetrics' accuracy with top_k=1.
+# Like torchmetrics, the macro average excludes classes that
+# are neither in the labels nor in the predictions.
+def accuracy_from_confusion(confusion, average):
+    if average == "micro":
+        tp = torch.diagonal(confusion, dim1=-2, dim2=-1).sum(dim=-1)
+        return tp.float() / confusion.sum(dim=(-2, -1)).float()
+    if average == "macro":
+        present = (confusion.sum(dim=-1) + confusion.sum(dim=-2)) > 0
+        per_class = per_class_accuracy(confusion)
+        return torch.sum(per_class * present, dim=-1) / torch.sum(present, dim=-1)
+    raise ValueError(f"average must be 'micro' or 'macro', but got {average}")
+
+
+# The confusion matrix of each split is cached in the EpochCache,
+# so the micro and macro accuracies of a split share one bincount.
 class Accuracy(BaseConfig):
-    def __init__(self, config):
-        super().__init__(config)
-        self.validator = AccuracyValidator
-
-    def actual_init(self, exp_config):
-        self.validator = self.validator(
-            key_map={self.split: "src_val"},
-            torchmetric_kwargs={
-                "average": self.validator_args["average"],
-                "num_classes": num_classes(exp_config["dataset"]),
-            },
-        )
+    batched = True
 
     def score(self, x, exp_config, device):
-        if self.validator is AccuracyValidator:
-            self.actual_init(exp_config)
-        logits = get_from_hdf5(x, device, f"inference/{self.split}/logits")
-        labels = get_from_hdf5(x, device, f"inference/{self.split}/labels")
-        preds = F.softmax(logits, dim=1)
-        return self.validator(**{self.split: {"preds": preds, "labels": labels}})
+        return self.score_epochs(x, exp_config, device).item()
+
+    # Also used by score, because confusion_matrices
+    # works with or without a leading epoch axis.
+    def score_epochs(self, x, exp_config, device):
+        confusion = self.get_confusion_matrix(x, device, exp_config)
+        return accuracy_from_confusion(confusion, self.validator_args["average"])
+
+    def get_confusion_matrix(self, x, device, exp_config):
+        def fn():
+            logits = get_from_hdf5(x, device, f"inference/{self.split}/logits")
+            labels = get_from_hdf5(x, device, f"inference/{self.split}/labels")
+            # the argmax of the logits is the argmax of the preds
+            preds = torch.argmax(logits, dim=-1)
+            return confusion_matrices(labels, preds, num_classes(exp_config["dataset"]))
+
+        if isinstance(x, EpochCache):
+            return x.get_or_compute(("confusion_matrix", self.split, str(device)), fn)
+        return fn()
 
     def expected_keys(self):
         return {"average", "split"}
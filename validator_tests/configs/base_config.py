@@ -3,19 +3,42 @@ import copy
 import torch
 import torch.nn.functional as F
 
+from validator_tests.utils.invariant_cache import read_dataset
+
+from .epoch_cache import EpochCache, to_torch
+
 
 def get_from_hdf5(x, device, key):
-    return torch.from_numpy(x[key][()]).to(device)
+    if isinstance(x, EpochCache):
+        return x.get(key, device)
+    return to_torch(read_dataset(x, key), device)
 
 
-def get_split_and_layer(x, split, layer, device):
+def get_split_and_layer(x, split, layer, device, normalize=False, p=2):
+    if isinstance(x, EpochCache):
+        return x.get_split_and_layer(split, layer, device, normalize, p)
     hdf5_layer = "logits" if layer == "preds" else layer
     features = get_from_hdf5(x, device, f"inference/{split}/{hdf5_layer}")
     if layer == "preds":
         features = F.softmax(features, dim=1)
+    if normalize:
+        features = F.normalize(features, dim=1, p=p)
     return features
 
 
+# Like get_split_and_layer, for an EpochCache of StackedEpochs,
+# so the output has a leading epoch axis.
+def get_stacked_split_and_layer(x, split, layer, device):
+    if layer == "preds":
+        return x.get_or_compute(
+            (f"inference/{split}/preds", str(device), None),
+            lambda: F.softmax(
+                get_stacked_split_and_layer(x, split, "logits", device), dim=-1
+            ),
+        )
+    return get_from_hdf5(x, device, f"inference/{split}/{layer}")
+
+
 def get_full_split_name(domain, split):
     return f"{domain}_{split}"
 
@@ -28,9 +51,18 @@ def get_target_domain(length, device):
     return torch.ones(length).to(device=device, dtype=torch.long)
 
 
-def use_src_and_target(x, device, validator, src_split_name, target_split_name, layer):
-    src = get_split_and_layer(x, src_split_name, layer, device)
-    target = get_split_and_layer(x, target_split_name, layer, device)
+def use_src_and_target(
+    x,
+    device,
+    validator,
+    src_split_name,
+    target_split_name,
+    layer,
+    normalize=False,
+    p=2,
+):
+    src = get_split_and_layer(x, src_split_name, layer, device, normalize, p)
+    target = get_split_and_layer(x, target_split_name, layer, device, normalize, p)
     return pass_src_and_target_to_validator(
         validator, src_split_name, target_split_name, layer, src, target, device
     )
@@ -54,20 +86,34 @@ def pass_src_and_target_to_validator(
 
 
 def use_labels_and_logits(
-    x, device, validator, src_split_name, target_split_name, layer
+    x,
+    device,
+    validator,
+    src_split_name,
+    target_split_name,
+    layer,
+    normalize=False,
+    p=2,
 ):
     src = {
-        k: get_split_and_layer(x, src_split_name, k, device) for k in [layer, "labels"]
+        "labels": get_split_and_layer(x, src_split_name, "labels", device),
+        layer: get_split_and_layer(x, src_split_name, layer, device, normalize, p),
     }
+    # if layer is "logits", the normalized logits are used for the pseudolabels,
+    # which doesn't change the argmax
     target = {
-        k: get_split_and_layer(x, target_split_name, k, device)
-        for k in [layer, "logits"]
+        "logits": get_split_and_layer(x, target_split_name, "logits", device),
+        layer: get_split_and_layer(x, target_split_name, layer, device, normalize, p),
     }
     kwargs = {src_split_name: src, target_split_name: target}
     return validator(**kwargs)
 
 
 class BaseConfig:
+    # If True, main.py scores several epochs of a trial at once with score_epochs,
+    # which should then be overridden with a vectorized version.
+    batched = False
+
     def __init__(self, config):
         self.validator_args = copy.deepcopy(config)
         if self.validator_args.keys() != self.expected_keys():
@@ -75,3 +121,15 @@ class BaseConfig:
                 f"expected {self.expected_keys()} but got {self.validator_args.keys()}"
             )
         self.split = self.validator_args.get("split", None)
+
+    # x is an EpochCache of StackedEpochs, so every dataset has a leading epoch axis.
+    # Returns a 1D tensor with one score per epoch.
+    # By default, each epoch is scored separately with score.
+    def score_epochs(self, x, exp_config, device):
+        stacked = x.x if isinstance(x, EpochCache) else x
+        return torch.tensor(
+            [
+                self.score(EpochCache(stacked.get_epoch(e)), exp_config, device)
+                for e in stacked.epochs
+            ]
+        )
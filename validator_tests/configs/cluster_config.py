@@ -1,17 +1,52 @@
+import torch
 import torch.nn.functional as F
 from pytorch_adapt.validators import ClassClusterValidator, KNNValidator
-from sklearn.cluster import KMeans
-from sklearn.metrics import adjusted_mutual_info_score, silhouette_score
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import adjusted_mutual_info_score
 
 from .base_config import BaseConfig, get_full_split_name, use_labels_and_logits
+from .epoch_cache import EpochCache
+from .kmeans import kmeans
 from .knn_config import KNN
+from .silhouette import silhouette_score
+
+# larger datasets are clustered with mini-batch k-means
+MINI_BATCH_MIN_SAMPLES = 50000
+MINI_BATCH_SIZE = 4096
+
+
+# The torch k-means is only faster than sklearn on GPUs,
+# so CPU tensors are clustered with sklearn.
+# Either way, the labels are returned as a tensor on x's device.
+def run_kmeans(x, n_clusters, init="k-means++"):
+    if x.is_cuda:
+        return run_torch_kmeans(x, n_clusters, init)
+    return run_sklearn_kmeans(x, n_clusters, init)
+
+
+def run_torch_kmeans(x, n_clusters, init):
+    if len(x) < MINI_BATCH_MIN_SAMPLES:
+        return kmeans(x, n_clusters, init)
+    return kmeans(x, n_clusters, init, max_iter=100, batch_size=MINI_BATCH_SIZE)
+
+
+def run_sklearn_kmeans(x, n_clusters, init):
+    if not isinstance(init, str):
+        init = init.cpu().numpy()
+    kwargs = {"n_clusters": n_clusters, "init": init, "n_init": 1, "random_state": 0}
+    if len(x) < MINI_BATCH_MIN_SAMPLES:
+        model = KMeans(**kwargs)
+    else:
+        model = MiniBatchKMeans(max_iter=100, batch_size=MINI_BATCH_SIZE, **kwargs)
+    labels = model.fit_predict(x.cpu().numpy())
+    return torch.from_numpy(labels).long().to(x.device)
 
 
 def kmeans_func(normalize, p):
     def fn(x, n_clusters):
         if normalize:
             x = F.normalize(x, dim=1, p=p)
-        return KMeans(n_clusters=n_clusters).fit_predict(x.cpu().numpy())
+        return run_kmeans(x, n_clusters)
 
     return fn
 
@@ -34,10 +69,100 @@ class DomainCluster(KNN):
     def set_k(self):
         pass
 
+    # clustering doesn't use the knn distances
+    def get_distances(self, x, device):
+        return None
+
     def expected_keys(self):
         return {"p", "normalize", "layer", "split"}
 
 
+# Like pytorch_adapt's get_centroids, but in torch.
+# Classes without any pseudolabels get a center of 0.
+def get_label_centers(feats, labels, num_classes):
+    sums = torch.zeros(num_classes, feats.shape[1], device=feats.device)
+    sums.index_add_(0, labels, feats.float())
+    counts = torch.bincount(labels, minlength=num_classes).unsqueeze(1)
+    return sums / counts.clamp(min=1)
+
+
+# Same as pytorch_adapt's get_clustering_performance without PCA,
+# but the clustering is done with run_kmeans, which uses the torch k-means on GPUs.
+# "features" score functions get torch tensors, "labels" score functions get numpy arrays.
+def get_clustering_performance(
+    feats,
+    labels,
+    num_classes,
+    score_fn,
+    score_fn_type,
+    src_feats=None,
+    src_labels=None,
+    centroid_init=None,
+    feat_normalizer=None,
+    cluster_fn=run_kmeans,
+):
+    if src_labels is not None:
+        feats = torch.cat((feats, src_feats), dim=0)
+        labels = torch.cat((labels, src_labels), dim=0)
+    if feat_normalizer:
+        feats = feat_normalizer(feats)
+
+    if centroid_init == "label_centers":
+        init = get_label_centers(feats, labels, num_classes)
+    else:
+        init = "k-means++"
+    clabels = cluster_fn(feats, num_classes, init)
+
+    if score_fn_type == "labels":
+        return score_fn(labels.cpu().numpy(), clabels.cpu().numpy())
+    elif score_fn_type == "features":
+        return score_fn(feats, clabels)
+
+
+# The cluster assignment of each (epoch, split, layer, normalize, with_src, init)
+# is cached, so that ClassAMI and ClassSS configs cluster the same features once.
+def get_cached_cluster_fn(x, cache_key):
+    def fn(feats, n_clusters, init):
+        if not isinstance(x, EpochCache):
+            return run_kmeans(feats, n_clusters, init)
+        return x.get_or_compute(cache_key, lambda: run_kmeans(feats, n_clusters, init))
+
+    return fn
+
+
+class TorchClassClusterValidator(ClassClusterValidator):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.src_for_pca or self.pca_size is not None:
+            raise ValueError("PCA is not supported")
+        self.cluster_fn = run_kmeans
+
+    def compute_score(self, target_train, src_train=None):
+        src_feats, src_labels = None, None
+        if self.with_src:
+            src_feats = src_train[self.layer]
+            src_labels = self.src_label_fn(src_train)
+        return get_clustering_performance(
+            target_train[self.layer],
+            self.target_label_fn(target_train),
+            target_train["logits"].shape[1],
+            self.score_fn,
+            self.score_fn_type,
+            src_feats=src_feats,
+            src_labels=src_labels,
+            centroid_init=self.centroid_init,
+            feat_normalizer=self.feat_normalizer,
+            cluster_fn=self.cluster_fn,
+        )
+
+
+def silhouette_fn(sample_size=None):
+    def fn(x, labels):
+        return silhouette_score(x, labels, sample_size=sample_size)
+
+    return fn
+
+
 def feat_normalizer_fn(normalize, p):
     def fn(x):
         if normalize:
@@ -60,7 +185,7 @@ class ClassAMI(BaseConfig):
 
     def create_validator(self):
         score_fn, score_fn_type = self.get_score_fn()
-        self.validator = ClassClusterValidator(
+        self.validator = TorchClassClusterValidator(
             key_map={
                 self.src_split_name: "src_train",
                 self.target_split_name: "target_train",
@@ -83,6 +208,20 @@ class ClassAMI(BaseConfig):
         return None
 
     def score(self, x, exp_config, device):
+        self.validator.cluster_fn = get_cached_cluster_fn(
+            x,
+            (
+                "cluster_labels",
+                self.src_split_name,
+                self.target_split_name,
+                self.layer,
+                str(device),
+                self.validator_args["normalize"],
+                self.validator_args["p"],
+                self.validator_args["with_src"],
+                self.get_centroid_init(),
+            ),
+        )
         return use_labels_and_logits(
             x,
             device,
@@ -103,7 +242,7 @@ class ClassAMICentroidInit(ClassAMI):
 
 class ClassSS(ClassAMI):
     def get_score_fn(self):
-        return silhouette_score, "features"
+        return silhouette_fn(), "features"
 
 
 class ClassSSCentroidInit(ClassSS):
@@ -120,3 +259,20 @@ class ClassSSCentroidInit(ClassSS):
             ):
                 return float("nan")
             raise
+
+
+# Estimates the silhouette score from a stratified sample of sample_size rows.
+class ClassSSSampled(ClassSS):
+    def get_score_fn(self):
+        return silhouette_fn(int(self.validator_args["sample_size"])), "features"
+
+    def expected_keys(self):
+        return super().expected_keys() | {"sample_size"}
+
+
+class ClassSSCentroidInitSampled(ClassSSCentroidInit):
+    def get_score_fn(self):
+        return silhouette_fn(int(self.validator_args["sample_size"])), "features"
+
+    def expected_keys(self):
+        return super().expected_keys() | {"sample_size"}
@@ -1,7 +1,11 @@
+import json
+
+import torch
 from pytorch_adapt.validators import DeepEmbeddedValidator
 from pytorch_adapt.validators.deep_embedded_validator import dev_binary_fn
 
 from .base_config import BaseConfig, get_split_and_layer
+from .dev_linear import LinearDEV
 
 
 class DEV(BaseConfig):
@@ -41,3 +45,43 @@ class DEVBinary(DEV):
     def __init__(self, config):
         super().__init__(config)
         self.validator.error_fn = dev_binary_fn
+
+
+# DEV with a linear discriminator that is trained in memory. See LinearDEV.
+# With warm_start, each epoch's discriminators start from
+# the previous epoch's, if it was from the same trial.
+# This only affects speed, not the scores (up to a relative difference of 1e-6).
+class DEVLinear(BaseConfig):
+    def __init__(self, config):
+        super().__init__(config)
+        self.layer = self.validator_args["layer"]
+        if self.validator_args["normalization"] == "None":
+            self.validator_args["normalization"] = None
+        self.validator_args["warm_start"] = bool(int(self.validator_args["warm_start"]))
+        self.validator = LinearDEV(
+            method=self.validator_args["method"],
+            error_fn=self.get_error_fn(),
+            normalization=self.validator_args["normalization"],
+            warm_start=self.validator_args["warm_start"],
+        )
+
+    def get_error_fn(self):
+        return torch.nn.CrossEntropyLoss(reduction="none")
+
+    def score(self, x, exp_config, device):
+        return self.validator(
+            src_train=get_split_and_layer(x, "src_train", self.layer, device),
+            src_val=get_split_and_layer(x, "src_val", self.layer, device),
+            target_train=get_split_and_layer(x, "target_train", self.layer, device),
+            logits=get_split_and_layer(x, "src_val", "logits", device),
+            labels=get_split_and_layer(x, "src_val", "labels", device),
+            key=json.dumps(exp_config, sort_keys=True),
+        )
+
+    def expected_keys(self):
+        return {"layer", "normalization", "method", "warm_start"}
+
+
+class DEVLinearBinary(DEVLinear):
+    def get_error_fn(self):
+        return dev_binary_fn
@@ -0,0 +1,139 @@
+import torch
+import torch.nn.functional as F
+from pytorch_adapt.validators.deep_embedded_validator import get_dev_risk
+
+DEV_LINEAR_METHODS = ["lda", "lbfgs"]
+# same weight decays as pytorch_adapt's DEV
+DECAYS = [1e-1, 3e-2, 1e-2, 3e-3, 1e-3, 3e-4, 1e-4, 3e-5, 1e-5]
+# Tight enough that the solution doesn't depend on the initial values
+# (relative score differences below 1e-6), so warm starting only affects speed.
+TOLERANCE_GRAD, TOLERANCE_CHANGE = 1e-9, 1e-12
+
+
+def train_test_split(x, y, train_size, generator):
+    idx = torch.randperm(len(x), generator=generator).to(x.device)
+    num_train = int(len(x) * train_size)
+    train, test = idx[:num_train], idx[num_train:]
+    return x[train], x[test], y[train], y[test]
+
+
+# Mean of the per-domain accuracies, like AccuracyValidator with average="macro".
+def macro_accuracy(logits, y):
+    correct = (logits > 0) == y.bool()
+    return torch.mean(torch.stack([correct[y == i].float().mean() for i in [0, 1]]))
+
+
+# Linear discriminant analysis with a shared covariance,
+# shrunk towards the identity by each decay.
+# Returns one (weights, bias) per decay.
+def fit_lda(x, y, decays):
+    x1, x0 = x[y == 1], x[y == 0]
+    mean1, mean0 = x1.mean(dim=0), x0.mean(dim=0)
+    centered = torch.cat([x1 - mean1, x0 - mean0], dim=0)
+    cov = centered.T @ centered / len(x)
+    eigvals, eigvecs = torch.linalg.eigh(cov)
+    diff = eigvecs.T @ (mean1 - mean0)
+    log_prior = torch.log(torch.tensor(len(x1) / len(x0), dtype=x.dtype))
+    output = []
+    for decay in decays:
+        w = eigvecs @ (diff / (eigvals.clamp(min=0) + decay))
+        b = -torch.dot(mean1 + mean0, w) / 2 + log_prior
+        output.append((w, b))
+    return output
+
+
+# L2 regularized logistic regression, trained with full-batch LBFGS.
+# init is an optional (weights, bias) to start from.
+def fit_logistic_regression(x, y, decay, init=None, max_iter=500):
+    if init is None:
+        params = torch.zeros(x.shape[1] + 1, dtype=x.dtype, device=x.device)
+    else:
+        params = torch.cat([init[0], init[1].view(1)])
+    params.requires_grad_(True)
+    optimizer = torch.optim.LBFGS(
+        [params],
+        max_iter=max_iter,
+        tolerance_grad=TOLERANCE_GRAD,
+        tolerance_change=TOLERANCE_CHANGE,
+        line_search_fn="strong_wolfe",
+    )
+    y = y.to(x.dtype)
+
+    def closure():
+        optimizer.zero_grad()
+        logits = x @ params[:-1] + params[-1]
+        loss = F.binary_cross_entropy_with_logits(logits, y)
+        loss = loss + decay / 2 * torch.sum(params[:-1] ** 2)
+        loss.backward()
+        return loss
+
+    optimizer.step(closure)
+    params = params.detach()
+    return params[:-1], params[-1]
+
+
+class LinearDEV:
+    """
+    Same as pytorch_adapt's DeepEmbeddedValidator,
+    but with a linear domain discriminator that is trained in memory,
+    instead of an MLP that is trained with checkpoints in a temp folder.
+    method is "lda" (closed form) or "lbfgs" (logistic regression).
+    As in DeepEmbeddedValidator, the discriminator is trained on 80% of
+    src_train + target_train, for every weight decay, and the one with the
+    best accuracy on the other 20% is used to weight the src_val errors.
+    If warm_start is True, the logistic regressions start from the previous
+    call's solutions, when the previous call had the same key.
+    The previous call depends on the order in which epochs are visited,
+    which differs between sequential, parallel and resumed runs.
+    So LBFGS is run until the solution doesn't depend on where it started,
+    and the scores are the same as without warm_start, up to a relative
+    difference of 1e-6.
+    """
+
+    def __init__(self, method, error_fn, normalization, warm_start=False, seed=0):
+        if method not in DEV_LINEAR_METHODS:
+            raise ValueError(f"method must be one of {DEV_LINEAR_METHODS}")
+        self.method = method
+        self.error_fn = error_fn
+        self.normalization = normalization
+        self.warm_start = warm_start
+        self.seed = seed
+        self.prev_key = None
+        self.prev_solutions = None
+
+    def __call__(self, src_train, src_val, target_train, logits, labels, key=None):
+        x = torch.cat([src_train, target_train], dim=0).double()
+        y = torch.cat(
+            [
+                torch.ones(len(src_train), dtype=torch.long, device=x.device),
+                torch.zeros(len(target_train), dtype=torch.long, device=x.device),
+            ]
+        )
+        generator = torch.Generator().manual_seed(self.seed)
+        x_train, x_test, y_train, y_test = train_test_split(x, y, 0.8, generator)
+        # standardize, so that the decays have the same effect for every layer
+        mean, std = x_train.mean(dim=0), x_train.std(dim=0).clamp(min=1e-8)
+        x_train, x_test = (x_train - mean) / std, (x_test - mean) / std
+
+        solutions = self.fit(x_train, y_train, key)
+        accuracies = [macro_accuracy(x_test @ w + b, y_test) for w, b in solutions]
+        w, b = solutions[int(torch.argmax(torch.stack(accuracies)))]
+
+        # exp(-logit) = P(target | x) / P(src | x)
+        val_logits = ((src_val.double() - mean) / std) @ w + b
+        weights = torch.exp(-val_logits) * (len(src_train) / len(target_train))
+        error = self.error_fn(logits, labels)
+        return -get_dev_risk(weights[:, None], error[:, None], self.normalization)
+
+    def fit(self, x, y, key):
+        if self.method == "lda":
+            return fit_lda(x, y, DECAYS)
+        inits = [None] * len(DECAYS)
+        if self.warm_start and key is not None and key == self.prev_key:
+            inits = self.prev_solutions
+        solutions = [
+            fit_logistic_regression(x, y, decay, init)
+            for decay, init in zip(DECAYS, inits)
+        ]
+        self.prev_key, self.prev_solutions = key, solutions
+        return solutions
@@ -1,9 +1,13 @@
+import torch
+from pytorch_adapt.layers.entropy_loss import entropy_after_softmax
 from pytorch_adapt.validators import DiversityValidator
 
-from .base_config import BaseConfig, get_from_hdf5
+from .base_config import BaseConfig, get_from_hdf5, get_stacked_split_and_layer
 
 
 class Diversity(BaseConfig):
+    batched = True
+
     def __init__(self, config):
         super().__init__(config)
         self.validator = DiversityValidator(
@@ -14,5 +18,10 @@ class Diversity(BaseConfig):
         logits = get_from_hdf5(x, device, f"inference/{self.split}/logits")
         return self.validator(**{self.split: {"logits": logits}})
 
+    # the entropy of each epoch's mean prediction
+    def score_epochs(self, x, exp_config, device):
+        preds = get_stacked_split_and_layer(x, self.split, "preds", device)
+        return entropy_after_softmax(torch.mean(preds, dim=1))
+
     def expected_keys(self):
         return {"split"}
@@ -1,9 +1,12 @@
+from pytorch_adapt.layers.entropy_loss import entropy
 from pytorch_adapt.validators import EntropyValidator
 
 from .base_config import BaseConfig, get_from_hdf5
 
 
 class Entropy(BaseConfig):
+    batched = True
+
     def __init__(self, config):
         super().__init__(config)
         self.validator = EntropyValidator(
@@ -14,5 +17,10 @@ class Entropy(BaseConfig):
         logits = get_from_hdf5(x, device, f"inference/{self.split}/logits")
         return self.validator(**{self.split: {"logits": logits}})
 
+    def score_epochs(self, x, exp_config, device):
+        logits = get_from_hdf5(x, device, f"inference/{self.split}/logits")
+        entropies = entropy(logits.reshape(-1, logits.shape[-1]))
+        return -entropies.view(logits.shape[:-1]).mean(dim=1)
+
     def expected_keys(self):
         return {"split"}
@@ -0,0 +1,192 @@
+import time
+from collections import OrderedDict
+
+import torch
+import torch.nn.functional as F
+
+from validator_tests.utils.invariant_cache import read_dataset
+
+
+def num_bytes(x):
+    return x.element_size() * x.nelement()
+
+
+# Features saved with --feature_dtype float16 are converted to float32,
+# and labels saved as compact integer types are converted to int64.
+def to_torch(x, device):
+    x = torch.from_numpy(x).to(device)
+    if x.dtype == torch.float16:
+        return x.float()
+    if x.dtype in [torch.int8, torch.int16, torch.int32, torch.uint8]:
+        return x.long()
+    return x
+
+
+# What EpochCache records while a cached tensor is computed:
+# the inputs it reads, the time spent in nested computations,
+# and the cached tensors it computes or reuses.
+class ComputeFrame:
+    def __init__(self):
+        self.input_shapes = {}
+        self.nested_time = 0
+        self.keys = set()
+
+
+# Wraps one epoch of features.hdf5 (or the in-memory dict from read_epoch_into_memory)
+# so that configs scored on the same epoch share decoded tensors,
+# softmaxed preds and normalized features.
+# Cached tensors are shared, so configs must not modify them in place.
+# Pairwise distance matrices (see shared_distances.py) are only cached
+# if they are at most max_matrix_bytes.
+# input_shapes has the shape of every split and layer that has been requested,
+# so that main.py can record the input sizes of each config.
+# Requests answered by a cached tensor count too, including the inputs
+# of the computation that produced it (e.g. the features of a distance matrix).
+# For --record_costs, the time it takes to compute each cached tensor is also kept,
+# so that the work a config reuses from earlier configs can be told apart
+# from the work it does. reset_costs is called before each config.
+class EpochCache:
+    def __init__(self, x, max_bytes=None, max_matrix_bytes=0):
+        self.x = x
+        self.max_bytes = max_bytes
+        self.max_matrix_bytes = max_matrix_bytes
+        self.tensors = OrderedDict()
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        # synchronize CUDA after each computation, so that its time is accurate
+        self.record_costs = False
+        # cache key -> (input shapes, time excluding nested computations,
+        # keys of the cached tensors computed or reused inside it)
+        self.computed = {}
+        # the ComputeFrame of each computation in progress, outermost first
+        self.computing = []
+        self.reset_costs()
+
+    def reset_costs(self):
+        self.input_shapes = {}
+        self.shared_time = 0
+        self.computed_keys = set()
+        self.reused_keys = set()
+        self.hit_keys = set()
+
+    # Time spent computing cached tensors that were reused,
+    # excluding those that were computed since reset_costs.
+    def get_reused_time(self):
+        keys = self.reused_keys - self.computed_keys
+        return sum(self.computed[k][1] for k in keys)
+
+    # Number of cached tensors that were requested directly and
+    # weren't computed since reset_costs, i.e. came from earlier configs.
+    def get_num_reused(self):
+        return len(self.hit_keys - self.computed_keys)
+
+    def record_shape(self, name, shape):
+        self.input_shapes[name] = shape
+        for frame in self.computing:
+            frame.input_shapes[name] = shape
+
+    def __getitem__(self, key):
+        return self.x[key]
+
+    def __contains__(self, key):
+        return key in self.x
+
+    def get(self, key, device):
+        output = self.get_or_compute(
+            (key, str(device), None),
+            lambda: to_torch(read_dataset(self.x, key), device),
+        )
+        self.record_shape(key, tuple(output.shape))
+        return output
+
+    def get_split_and_layer(self, split, layer, device, normalize=False, p=2):
+        self.record_shape(f"inference/{split}/{layer}", self.get_shape(split, layer))
+        if normalize:
+            return self.get_or_compute(
+                (f"inference/{split}/{layer}", str(device), p),
+                lambda: F.normalize(
+                    self.get_split_and_layer(split, layer, device), dim=1, p=p
+                ),
+            )
+        if layer == "preds":
+            return self.get_or_compute(
+                (f"inference/{split}/{layer}", str(device), None),
+                lambda: F.softmax(
+                    self.get_split_and_layer(split, "logits", device), dim=1
+                ),
+            )
+        return self.get(f"inference/{split}/{layer}", device)
+
+    # preds have the same shape as logits
+    def get_shape(self, split, layer):
+        hdf5_layer = "logits" if layer == "preds" else layer
+        return tuple(self.x[f"inference/{split}/{hdf5_layer}"].shape)
+
+    def can_cache_matrix(self, num_bytes):
+        if self.max_bytes is not None and num_bytes > self.max_bytes:
+            return False
+        return num_bytes <= self.max_matrix_bytes
+
+    def get_or_compute(self, cache_key, fn):
+        if cache_key in self.tensors:
+            self.hits += 1
+            self.tensors.move_to_end(cache_key)
+            self.reuse(cache_key)
+            return self.tensors[cache_key]
+        self.misses += 1
+        output = self.compute(cache_key, fn)
+        self.tensors[cache_key] = output
+        self.num_bytes += num_bytes(output)
+        self.evict()
+        return output
+
+    def compute(self, cache_key, fn):
+        frame = ComputeFrame()
+        self.computing.append(frame)
+        start = time.perf_counter()
+        try:
+            output = fn()
+            if self.record_costs and output.is_cuda:
+                torch.cuda.synchronize(output.device)
+        finally:
+            self.computing.pop()
+        duration = time.perf_counter() - start
+        self.computed[cache_key] = (
+            frame.input_shapes,
+            duration - frame.nested_time,
+            frame.keys,
+        )
+        self.computed_keys.add(cache_key)
+        for f in self.computing:
+            f.keys.add(cache_key)
+        if len(self.computing) > 0:
+            self.computing[-1].nested_time += duration
+        else:
+            self.shared_time += duration
+        return output
+
+    def reuse(self, cache_key):
+        input_shapes, _, keys = self.computed[cache_key]
+        for name, shape in input_shapes.items():
+            self.record_shape(name, shape)
+        keys = keys | {cache_key}
+        self.reused_keys |= keys
+        if len(self.computing) == 0:
+            self.hit_keys.add(cache_key)
+        for f in self.computing:
+            f.keys |= keys
+
+    # least recently used tensors are evicted first,
+    # but the most recent one is always kept
+    def evict(self):
+        if self.max_bytes is None:
+            return
+        while self.num_bytes > self.max_bytes and len(self.tensors) > 1:
+            _, x = self.tensors.popitem(last=False)
+            self.num_bytes -= num_bytes(x)
+
+    def clear(self):
+        self.tensors.clear()
+        self.computed.clear()
+        self.num_bytes = 0
@@ -0,0 +1,138 @@
+import math
+
+import torch
+
+
+# Returns the index of each row's nearest center, and the squared distance to it.
+# Computed in chunks of rows to limit memory.
+def assign_to_centers(x, centers, chunk_size=4096):
+    labels = torch.empty(len(x), dtype=torch.long, device=x.device)
+    min_dists = torch.empty(len(x), dtype=x.dtype, device=x.device)
+    for s in range(0, len(x), chunk_size):
+        dists = torch.cdist(x[s : s + chunk_size], centers) ** 2
+        min_dists[s : s + chunk_size], labels[s : s + chunk_size] = torch.min(
+            dists, dim=1
+        )
+    return labels, min_dists
+
+
+# Mean of each cluster. Clusters without any rows keep their previous center.
+def get_cluster_means(x, labels, n_clusters, prev_centers=None):
+    sums = torch.zeros(n_clusters, x.shape[1], dtype=x.dtype, device=x.device)
+    sums.index_add_(0, labels, x)
+    counts = torch.bincount(labels, minlength=n_clusters).unsqueeze(1)
+    means = sums / counts.clamp(min=1)
+    if prev_centers is not None:
+        means = torch.where(counts > 0, means, prev_centers)
+    return means
+
+
+# Greedy k-means++, like sklearn:
+# each new center is the best of several candidates sampled by D^2 weighting.
+def kmeans_plusplus(x, n_clusters, generator):
+    n_local_trials = 2 + int(math.log(n_clusters))
+    first = torch.randint(len(x), (1,), generator=generator, device=x.device)
+    centers = [x[first]]
+    closest = torch.cdist(x[first], x).squeeze(0) ** 2
+    for _ in range(1, n_clusters):
+        total = closest.sum()
+        probs = closest / total if total > 0 else torch.ones_like(closest)
+        candidates = torch.multinomial(
+            probs, n_local_trials, replacement=True, generator=generator
+        )
+        new_closest = torch.minimum(closest, torch.cdist(x[candidates], x) ** 2)
+        best = torch.argmin(new_closest.sum(dim=1))
+        centers.append(x[candidates[best]].unsqueeze(0))
+        closest = new_closest[best]
+    return torch.cat(centers, dim=0)
+
+
+def lloyd(x, centers, max_iter, tol):
+    for _ in range(max_iter):
+        labels, _ = assign_to_centers(x, centers)
+        new_centers = get_cluster_means(x, labels, len(centers), centers)
+        shift = torch.sum((new_centers - centers) ** 2)
+        centers = new_centers
+        if shift <= tol:
+            break
+    return centers
+
+
+# Each step moves the centers towards the means of a random batch,
+# with a per-center learning rate of 1 / (number of rows assigned so far).
+# Like sklearn, it stops early when the centers barely move, or when the
+# smoothed batch inertia hasn't improved for max_no_improvement steps.
+def mini_batch(x, centers, max_iter, tol, batch_size, generator, max_no_improvement=10):
+    n_clusters = len(centers)
+    counts = torch.zeros(n_clusters, dtype=x.dtype, device=x.device)
+    alpha = min(1.0, batch_size * 2.0 / (len(x) + 1))
+    ewa_inertia, best_inertia, no_improvement = None, None, 0
+    for _ in range(max_iter * math.ceil(len(x) / batch_size)):
+        idx = torch.randint(len(x), (batch_size,), generator=generator, device=x.device)
+        batch = x[idx]
+        labels, min_dists = assign_to_centers(batch, centers)
+        batch_counts = torch.bincount(labels, minlength=n_clusters).to(x.dtype)
+        counts += batch_counts
+        batch_means = get_cluster_means(batch, labels, n_clusters, centers)
+        lr = (batch_counts / counts.clamp(min=1)).unsqueeze(1)
+        new_centers = centers + lr * (batch_means - centers)
+        shift = torch.sum((new_centers - centers) ** 2)
+        centers = new_centers
+        if shift <= tol:
+            break
+
+        inertia = torch.mean(min_dists).item()
+        if ewa_inertia is None:
+            ewa_inertia = inertia
+        else:
+            ewa_inertia = ewa_inertia * (1 - alpha) + inertia * alpha
+        if best_inertia is None or ewa_inertia < best_inertia:
+            best_inertia, no_improvement = ewa_inertia, 0
+        else:
+            no_improvement += 1
+            if no_improvement >= max_no_improvement:
+                break
+    return centers
+
+
+def kmeans(
+    x,
+    n_clusters,
+    init="k-means++",
+    n_init=1,
+    max_iter=300,
+    tol=1e-4,
+    batch_size=None,
+    seed=0,
+):
+    """
+    Returns the cluster index of each row of x, as a tensor on x's device.
+    init is either "k-means++" or a tensor of initial centers.
+    n_init is the number of runs, of which the one with the lowest inertia
+    is kept. Like sklearn's n_init="auto" with these inits, it defaults to 1.
+    If batch_size is None, Lloyd's algorithm is used.
+    Otherwise mini-batch k-means is used, and max_iter is the maximum number
+    of passes over the data.
+    tol is relative to the mean variance of the features, like in sklearn.
+    """
+    x = x.float()
+    if isinstance(init, str) and init != "k-means++":
+        raise ValueError("init must be 'k-means++' or a tensor of centers")
+    generator = torch.Generator(device=x.device).manual_seed(seed)
+    tol = tol * torch.mean(torch.var(x, dim=0, unbiased=False))
+
+    best_labels, best_inertia = None, None
+    for _ in range(n_init):
+        if isinstance(init, str):
+            centers = kmeans_plusplus(x, n_clusters, generator)
+        else:
+            centers = init.to(device=x.device, dtype=x.dtype)
+        if batch_size is None:
+            centers = lloyd(x, centers, max_iter, tol)
+        else:
+            centers = mini_batch(x, centers, max_iter, tol, batch_size, generator)
+        labels, min_dists = assign_to_centers(x, centers)
+        inertia = torch.sum(min_dists)
+        if best_inertia is None or inertia < best_inertia:
+            best_labels, best_inertia = labels, inertia
+    return best_labels
@@ -1,13 +1,40 @@
+import numpy as np
+import torch
 from pytorch_adapt.validators import KNNValidator, TargetKNNValidator
 from pytorch_metric_learning.distances import LpDistance
-from pytorch_metric_learning.utils.inference import CustomKNN
+from pytorch_metric_learning.utils.inference import CustomKNN, return_results
 
 from .base_config import (
     BaseConfig,
     get_full_split_name,
+    get_split_and_layer,
     use_labels_and_logits,
     use_src_and_target,
 )
+from .projected_knn import ProjectedBruteForceKNN
+from .shared_distances import get_pooled_distances
+
+
+class SharedDistancesKNN:
+    """
+    A knn_func that reads the distances from self.mat,
+    which must have a row for every query and a column for every reference.
+    If self.mat is None, it uses the wrapped knn_func instead.
+    """
+
+    def __init__(self, knn_func):
+        self.knn_func = knn_func
+        self.mat = None
+
+    def __call__(self, query, k, reference, embeddings_come_from_same_source=False):
+        if self.mat is None:
+            return self.knn_func(query, k, reference, embeddings_come_from_same_source)
+        if self.mat.shape != (len(query), len(reference)):
+            raise ValueError("the distance matrix doesn't match query and reference")
+        if embeddings_come_from_same_source:
+            k = k + 1
+        distances, indices = torch.topk(self.mat, k, largest=False, dim=1)
+        return return_results(distances, indices, embeddings_come_from_same_source)
 
 
 class KNN(BaseConfig):
@@ -20,24 +47,43 @@ class KNN(BaseConfig):
         self.src_split_name = get_full_split_name("src", self.split)
         self.target_split_name = get_full_split_name("target", self.split)
 
-        knn_func = CustomKNN(
-            LpDistance(
-                normalize_embeddings=self.validator_args["normalize"],
-                p=self.validator_args["p"],
-            ),
+        self.knn_func = SharedDistancesKNN(self.get_knn_func())
+        self.validator = self.create_validator(self.knn_func)
+
+    def get_knn_func(self):
+        # embeddings are normalized in score(), so they can be shared across configs
+        return CustomKNN(
+            LpDistance(normalize_embeddings=False, p=self.validator_args["p"]),
             batch_size=512,
         )
 
-        self.validator = self.create_validator(knn_func)
-
     def score(self, x, exp_config, device):
-        return use_src_and_target(
+        distances = self.get_distances(x, device)
+        if distances is not None:
+            self.knn_func.mat = distances[0]
+        try:
+            return use_src_and_target(
+                x,
+                device,
+                self.validator,
+                self.src_split_name,
+                self.target_split_name,
+                self.layer,
+                self.validator_args["normalize"],
+                self.validator_args["p"],
+            )
+        finally:
+            self.knn_func.mat = None
+
+    def get_distances(self, x, device):
+        return get_pooled_distances(
             x,
-            device,
-            self.validator,
             self.src_split_name,
             self.target_split_name,
             self.layer,
+            device,
+            self.validator_args["normalize"],
+            self.validator_args["p"],
         )
 
     def create_validator(self, knn_func):
@@ -66,6 +112,9 @@ class KNN(BaseConfig):
 
 class TargetKNN(KNN):
     def score(self, x, exp_config, device):
+        distances = self.get_distances(x, device)
+        if distances is not None:
+            return self.score_with_distances(x, device, *distances)
         return use_labels_and_logits(
             x,
             device,
@@ -73,8 +122,53 @@ class TargetKNN(KNN):
             self.src_split_name,
             self.target_split_name,
             self.layer,
+            self.validator_args["normalize"],
+            self.validator_args["p"],
         )
 
+    # Same as TargetKNNValidator.compute_score,
+    # but each knn search uses rows and columns of the pooled distance matrix.
+    def score_with_distances(self, x, device, mat, num_src):
+        src_split, target_split = self.src_split_name, self.target_split_name
+        normalize, p = self.validator_args["normalize"], self.validator_args["p"]
+        src = get_split_and_layer(x, src_split, self.layer, device, normalize, p)
+        target = get_split_and_layer(x, target_split, self.layer, device, normalize, p)
+        src_labels = get_split_and_layer(x, src_split, "labels", device)
+        target_labels = torch.argmax(
+            get_split_and_layer(x, target_split, "logits", device), dim=1
+        )
+        src_idx = torch.arange(num_src, device=device)
+        target_idx = torch.arange(num_src, len(mat), device=device)
+
+        data = []
+        if self.validator_args["T_in_ref"]:
+            for L in torch.unique(target_labels):
+                mask = target_labels == L
+                data.append(
+                    (
+                        target_idx[mask],
+                        torch.cat([src_idx, target_idx[~mask]], dim=0),
+                        target[mask],
+                        torch.cat([src, target[~mask]], dim=0),
+                        target_labels[mask],
+                        torch.cat([src_labels, target_labels[~mask]], dim=0),
+                    )
+                )
+        else:
+            data.append((target_idx, src_idx, target, src, target_labels, src_labels))
+
+        scores = []
+        try:
+            for rows, cols, *d in data:
+                self.knn_func.mat = mat[rows][:, cols]
+                accuracies = self.validator.acc_fn.get_accuracy(
+                    *d, embeddings_come_from_same_source=False
+                )
+                scores.append(accuracies[self.validator.metric])
+        finally:
+            self.knn_func.mat = None
+        return np.mean(scores)
+
     def create_validator(self, knn_func):
         self.validator_args["T_in_ref"] = bool(int(self.validator_args["T_in_ref"]))
         batch_size = None if self.validator_args["k"] <= 1000 else 256
@@ -101,3 +195,34 @@ class TargetKNN(KNN):
 class TargetKNNLogits(TargetKNN):
     def set_layer(self):
         self.layer = "logits"
+
+
+def get_projected_knn_func(validator_args):
+    if validator_args["p"] != 2:
+        raise ValueError("the projected knn configs only support p = 2")
+    validator_args["proj_dim"] = int(validator_args["proj_dim"])
+    return ProjectedBruteForceKNN(proj_dim=validator_args["proj_dim"])
+
+
+# The projected configs don't use the shared distances,
+# because computing those is the exact search that they approximate.
+class KNNProjected(KNN):
+    def get_knn_func(self):
+        return get_projected_knn_func(self.validator_args)
+
+    def get_distances(self, x, device):
+        return None
+
+    def expected_keys(self):
+        return super().expected_keys() | {"proj_dim"}
+
+
+class TargetKNNProjected(TargetKNN):
+    def get_knn_func(self):
+        return get_projected_knn_func(self.validator_args)
+
+    def get_distances(self, x, device):
+        return None
+
+    def expected_keys(self):
+        return super().expected_keys() | {"proj_dim"}
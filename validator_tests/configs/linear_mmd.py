@@ -0,0 +1,124 @@
+import math
+
+import torch
+from pytorch_adapt.layers.utils import get_default_kernel_weights
+
+LINEAR_MMD_METHODS = ["rff", "nystrom"]
+
+
+# Median of the squared L2 distances between (a sample of) the rows of x,
+# like the bandwidth that pytorch_adapt's MMD computes from all rows of x.
+def get_median_bandwidth(x, sample_size, generator):
+    if len(x) > sample_size:
+        x = x[torch.randperm(len(x), generator=generator)[:sample_size].to(x.device)]
+    return torch.median(torch.cdist(x, x) ** 2)
+
+
+# Returns (sum of feature vectors, sum of squared feature norms) over the rows of x,
+# computed batch_size rows at a time, so the feature matrix is never stored.
+def sum_features(x, feature_fn, batch_size):
+    total, total_sq = 0, 0
+    for s in range(0, len(x), batch_size):
+        z = feature_fn(x[s : s + batch_size]).double()
+        total = total + torch.sum(z, dim=0)
+        total_sq = total_sq + torch.sum(z**2)
+    return total, total_sq
+
+
+# Unbiased MMD^2 for the kernel k(a, b) = z(a) . z(b),
+# i.e. the same estimator as the quadratic MMD, which excludes the diagonals.
+def mmd_from_feature_sums(x_sums, y_sums, num_x, num_y):
+    (sx, sqx), (sy, sqy) = x_sums, y_sums
+    xx = (torch.dot(sx, sx) - sqx) / (num_x * (num_x - 1))
+    yy = (torch.dot(sy, sy) - sqy) / (num_y * (num_y - 1))
+    xy = torch.dot(sx, sy) / (num_x * num_y)
+    return xx + yy - 2 * xy
+
+
+class LinearMMDLoss(torch.nn.Module):
+    """
+    Linear-time approximation of pytorch_adapt's quadratic MMD,
+    for the same multi-bandwidth kernel:
+    k(a, b) = sum_j w_j * exp(-kernel_scales[j] * ||a - b||^2 / bandwidth)
+    The kernel is approximated by an explicit feature map z,
+    so that MMD^2 only needs the sums of z over each domain.
+    method is either "rff" (random Fourier features, num_features per kernel scale)
+    or "nystrom" (num_features landmarks, sampled from both domains).
+    If bandwidth is None, it is the median squared distance between
+    (at most bandwidth_sample_size) source rows.
+    """
+
+    def __init__(
+        self,
+        kernel_scales,
+        bandwidth=None,
+        method="rff",
+        num_features=1024,
+        batch_size=4096,
+        bandwidth_sample_size=4096,
+        seed=0,
+    ):
+        super().__init__()
+        if method not in LINEAR_MMD_METHODS:
+            raise ValueError(f"method must be one of {LINEAR_MMD_METHODS}")
+        self.kernel_scales = torch.as_tensor(kernel_scales).flatten()
+        self.bandwidth = bandwidth
+        self.method = method
+        self.num_features = num_features
+        self.batch_size = batch_size
+        self.bandwidth_sample_size = bandwidth_sample_size
+        self.seed = seed
+
+    def forward(self, x, y):
+        generator = torch.Generator().manual_seed(self.seed)
+        bandwidth = self.bandwidth
+        if bandwidth is None:
+            bandwidth = get_median_bandwidth(x, self.bandwidth_sample_size, generator)
+        gammas = self.kernel_scales.to(device=x.device, dtype=x.dtype) / bandwidth
+        weights = torch.as_tensor(get_default_kernel_weights(gammas)).to(gammas)
+        weights = weights.expand_as(gammas)
+        if self.method == "rff":
+            feature_fn = self.get_rff_fn(x.shape[1], gammas, weights, generator)
+        else:
+            feature_fn = self.get_nystrom_fn(x, y, gammas, weights, generator)
+        x_sums = sum_features(x, feature_fn, self.batch_size)
+        y_sums = sum_features(y, feature_fn, self.batch_size)
+        return mmd_from_feature_sums(x_sums, y_sums, len(x), len(y))
+
+    # exp(-gamma * ||a - b||^2) = E[cos(w.a + b) * cos(w.b + b)] * 2,
+    # with w ~ N(0, 2 * gamma * I) and b ~ U(0, 2 * pi)
+    def get_rff_fn(self, dim, gammas, weights, generator):
+        num_kernels, num_features = len(gammas), self.num_features
+        w = torch.randn(dim, num_kernels, num_features, generator=generator)
+        b = torch.rand(num_kernels * num_features, generator=generator) * 2 * math.pi
+        w = w.to(gammas) * torch.sqrt(2 * gammas).view(1, -1, 1)
+        w, b = w.view(dim, -1), b.to(gammas)
+        coeffs = torch.sqrt(2 * weights / num_features).repeat_interleave(num_features)
+
+        def fn(x):
+            return torch.cos(x @ w + b) * coeffs
+
+        return fn
+
+    # z(a) = k(a, landmarks) @ K^(-1/2), where K = k(landmarks, landmarks)
+    def get_nystrom_fn(self, x, y, gammas, weights, generator):
+        pooled_size = len(x) + len(y)
+        idx = torch.randperm(pooled_size, generator=generator)[: self.num_features]
+        idx = idx.to(x.device)
+        from_x = idx < len(x)
+        landmarks = torch.cat([x[idx[from_x]], y[idx[~from_x] - len(x)]], dim=0)
+
+        def kernel(a):
+            sq_dists = torch.cdist(a, landmarks) ** 2
+            return torch.sum(
+                torch.exp(-sq_dists.unsqueeze(2) * gammas) * weights, dim=2
+            )
+
+        eigvals, eigvecs = torch.linalg.eigh(kernel(landmarks).double())
+        keep = eigvals > eigvals.max() * 1e-6
+        proj = (eigvecs[:, keep] / torch.sqrt(eigvals[keep])).to(x.dtype)
+
+        def fn(a):
+            return kernel(a) @ proj
+
+        return fn
@@ -1,16 +1,268 @@
-from pytorch_adapt.layers.utils import get_kernel_scales
-from pytorch_adapt.validators import MMDValidator, PerClassValidator
+from collections import defaultdict
+
+import torch
+from pytorch_adapt.layers.utils import get_default_kernel_weights, get_kernel_scales
+from pytorch_adapt.validators import BaseValidator, MMDValidator, PerClassValidator
 from pytorch_metric_learning.distances import LpDistance
+from pytorch_metric_learning.utils import common_functions as pml_cf
 
 from .base_config import (
     BaseConfig,
     get_full_split_name,
+    get_split_and_layer,
     use_labels_and_logits,
     use_src_and_target,
 )
+from .epoch_cache import EpochCache
+from .linear_mmd import LinearMMDLoss
+from .shared_distances import get_pooled_distances
+
+MMD_BATCH_SIZE = 512
+
+
+def get_median_bandwidth(xx, batch_size):
+    medians = [
+        torch.median(xx[s : s + batch_size] ** 2) for s in range(0, len(xx), batch_size)
+    ]
+    return torch.median(torch.stack(medians))
+
+
+# Same as pytorch_adapt's get_mmd_quadratic_batched,
+# but using the L2 distances of cat([x, y]), where x has num_src rows,
+# and computing several (kernel_scales, bandwidth) variants in one pass
+# over the squared distances. bandwidth=None means the median bandwidth.
+# Returns a tensor with one MMD per variant.
+def get_mmds_from_distances(mat, num_src, variants, batch_size):
+    xx, yy, xy = (
+        mat[:num_src, :num_src],
+        mat[num_src:, num_src:],
+        mat[:num_src, num_src:],
+    )
+    median = None
+    if any(bandwidth is None for _, bandwidth in variants):
+        median = get_median_bandwidth(xx, batch_size)
+    scales, weights = [], []
+    for kernel_scales, bandwidth in variants:
+        kernel_scales = pml_cf.to_device(kernel_scales, mat, dtype=mat.dtype)
+        scale = -kernel_scales / (median if bandwidth is None else bandwidth)
+        scales.append(scale)
+        weights.append(
+            torch.as_tensor(get_default_kernel_weights(scale)).expand_as(scale)
+        )
+    sizes = [len(x) for x in scales]
+    scales, weights = torch.cat(scales), torch.cat(weights).to(mat)
+
+    sums = []
+    for block, query_is_ref in [(xx, True), (yy, True), (xy, False)]:
+        rsum = 0
+        for s in range(0, len(block), batch_size):
+            curr = block[s : s + batch_size] ** 2
+            rsum += torch.sum(torch.exp(curr.unsqueeze(2) * scales), dim=(0, 1))
+            if query_is_ref:
+                # faster than masking out the diagonal before the sum
+                diag = torch.diagonal(curr, offset=s).unsqueeze(1)
+                rsum -= torch.sum(torch.exp(diag * scales), dim=0)
+        num_rows, num_cols = block.shape
+        denom = num_rows * (num_rows - 1) if query_is_ref else num_rows * num_cols
+        sums.append(rsum / denom)
+
+    per_scale = (sums[0] + sums[1] - 2 * sums[2]) * weights
+    return torch.stack([torch.sum(x) for x in torch.split(per_scale, sizes)])
+
+
+# Returns the scale of every (variant, kernel) for each bandwidth,
+# with shape (len(bandwidths), total number of kernels).
+# Variants whose bandwidth is None use bandwidths, and the others use their own.
+def get_scales_and_weights(variants, bandwidths):
+    scales, weights = [], []
+    for kernel_scales, bandwidth in variants:
+        kernel_scales = pml_cf.to_device(
+            kernel_scales, bandwidths, dtype=bandwidths.dtype
+        ).flatten()
+        curr = (
+            bandwidths if bandwidth is None else torch.full_like(bandwidths, bandwidth)
+        )
+        scales.append(-kernel_scales.unsqueeze(0) / curr.unsqueeze(1))
+        weights.append(
+            get_default_kernel_weights(kernel_scales) * torch.ones_like(kernel_scales)
+        )
+    sizes = [len(x) for x in weights]
+    return torch.cat(scales, dim=1), torch.cat(weights), sizes
+
+
+def get_per_class_scores(src, target, src_labels, target_labels, variants, batch_size):
+    """
+    Same as pytorch_adapt's PerClassValidator wrapped around MMDValidator:
+    the mean of -MMD over the classes that are in both the src labels
+    and the target pseudolabels, for several (kernel_scales, bandwidth) variants.
+    The rows are sorted by class, so each class's pairs are a diagonal block
+    of the pooled distance matrix. Blocks of batch_size rows are compared to
+    the columns of their classes, and the kernel sums of every class
+    are accumulated with one index_add_ per block.
+    Classes with fewer than 2 rows in either domain are skipped,
+    because their MMD is undefined (PerClassValidator returns NaN for them).
+    Returns a tensor with one score per variant, which is NaN if no class is left.
+    """
+    device = src.device
+    num_classes = int(max(src_labels.max(), target_labels.max())) + 1
+    src_counts = torch.bincount(src_labels, minlength=num_classes)
+    target_counts = torch.bincount(target_labels, minlength=num_classes)
+    valid = (src_counts >= 2) & (target_counts >= 2)
+    if not torch.any(valid):
+        return torch.full((len(variants),), float("nan"))
+
+    # sort by class, then domain, keeping only the valid classes
+    x = torch.cat([src, target], dim=0)
+    labels = torch.cat([src_labels, target_labels])
+    domains = torch.cat(
+        [
+            torch.zeros(len(src), dtype=torch.long, device=device),
+            torch.ones(len(target), dtype=torch.long, device=device),
+        ]
+    )
+    keep = valid[labels]
+    classes = (torch.cumsum(valid, dim=0) - 1)[labels[keep]]
+    order = torch.argsort(classes * 2 + domains[keep])
+    x, classes, domains = x[keep][order], classes[order], domains[keep][order]
+    num_src, num_target = src_counts[valid], target_counts[valid]
+    ends = torch.cumsum(num_src + num_target, dim=0)
+    starts = ends - num_src - num_target
+
+    bandwidths = torch.ones(len(num_src), dtype=x.dtype, device=device)
+    if any(bandwidth is None for _, bandwidth in variants):
+        bandwidths = torch.stack(
+            [
+                get_median_bandwidth(
+                    torch.cdist(x[s : s + n], x[s : s + n]), batch_size
+                )
+                for s, n in zip(starts.tolist(), num_src.tolist())
+            ]
+        )
+    scales, weights, sizes = get_scales_and_weights(variants, bandwidths)
+
+    # For each class: sums of the (src, src), (src, target) and (target, target) pairs.
+    # The kernel is symmetric, so each pair is only evaluated once,
+    # by comparing each block of rows to the columns after it in the same classes.
+    # The sums are in float64, because index_add_ accumulates sequentially.
+    sums = torch.zeros(
+        len(num_src) * 3, scales.shape[1], dtype=torch.float64, device=device
+    )
+    for s in range(0, len(x), batch_size):
+        e = min(s + batch_size, len(x))
+        col_e = ends[classes[e - 1]].item()
+        sq_dists = torch.cdist(x[s:e], x[s:col_e]) ** 2
+        row_classes, col_classes = classes[s:e], classes[s:col_e]
+        mask = row_classes.unsqueeze(1) == col_classes.unsqueeze(0)
+        mask = torch.triu(mask, diagonal=1)
+        # 0 for (src, src), 1 for (src, target), 2 for (target, target)
+        pair_types = domains[s:e].unsqueeze(1) + domains[s:col_e].unsqueeze(0)
+        pair_classes = row_classes.unsqueeze(1).expand_as(mask)[mask]
+        kernel = torch.exp(sq_dists[mask].unsqueeze(1) * scales[pair_classes])
+        sums.index_add_(0, pair_classes * 3 + pair_types[mask], kernel.double())
+
+    sums = sums.view(len(num_src), 3, -1)
+    num_src, num_target = num_src.unsqueeze(1), num_target.unsqueeze(1)
+    xx = 2 * sums[:, 0] / (num_src * (num_src - 1))
+    xy = sums[:, 1] / (num_src * num_target)
+    yy = 2 * sums[:, 2] / (num_target * (num_target - 1))
+    per_scale = (xx + yy - 2 * xy).to(weights) * weights
+    mmds = torch.stack([torch.sum(m, dim=1) for m in torch.split(per_scale, sizes, 1)])
+    return -torch.mean(mmds, dim=1)
+
+
+# Computes the scores of every MMD variant registered for this
+# (split, layer, normalize), from one distance matrix,
+# and caches them for the rest of the epoch.
+# Returns a dict from variant to score, or None if the distances can't be shared.
+def get_fused_scores(x, src_split, target_split, layer, device, normalize, variants):
+    distances = get_pooled_distances(
+        x, src_split, target_split, layer, device, normalize, p=2
+    )
+    if distances is None:
+        return None
+    mat, num_src = distances
+    variants = tuple(sorted(variants, key=str))
+
+    def fn():
+        curr_variants = [
+            (get_kernel_scales_from_exponent(exponent), bandwidth)
+            for exponent, bandwidth in variants
+        ]
+        scores = -get_mmds_from_distances(mat, num_src, curr_variants, MMD_BATCH_SIZE)
+        return scores.double().cpu()
+
+    scores = x.get_or_compute(
+        (
+            "mmd_scores",
+            src_split,
+            target_split,
+            layer,
+            str(device),
+            normalize,
+            variants,
+        ),
+        fn,
+    )
+    return dict(zip(variants, scores.tolist()))
+
+
+# Like get_fused_scores, but for the per-class variants, using get_per_class_scores.
+# The scores are only cached if x is an EpochCache.
+def get_fused_per_class_scores(
+    x, src_split, target_split, layer, device, normalize, variants
+):
+    variants = tuple(sorted(variants, key=str))
+
+    def fn():
+        src = get_split_and_layer(x, src_split, layer, device, normalize)
+        target = get_split_and_layer(x, target_split, layer, device, normalize)
+        src_labels = get_split_and_layer(x, src_split, "labels", device)
+        target_logits = get_split_and_layer(x, target_split, "logits", device)
+        scores = get_per_class_scores(
+            src,
+            target,
+            src_labels,
+            torch.argmax(target_logits, dim=1),
+            [
+                (get_kernel_scales_from_exponent(exponent), bandwidth)
+                for exponent, bandwidth in variants
+            ],
+            MMD_BATCH_SIZE,
+        )
+        return scores.double().cpu()
+
+    if isinstance(x, EpochCache):
+        scores = x.get_or_compute(
+            (
+                "mmd_per_class_scores",
+                src_split,
+                target_split,
+                layer,
+                str(device),
+                normalize,
+                variants,
+            ),
+            fn,
+        )
+    else:
+        scores = fn()
+    return dict(zip(variants, scores.tolist()))
+
+
+def get_kernel_scales_from_exponent(exponent):
+    return get_kernel_scales(
+        low=-exponent, high=exponent, num_kernels=(exponent * 2) + 1
+    )
 
 
 class MMD(BaseConfig):
+    # (split, layer, normalize, per_class) -> variants of every quadratic MMD config
+    # constructed in this process. When one of them is scored,
+    # the scores of the others are computed from the same distances.
+    variants = defaultdict(set)
+    fused = True
+    per_class = False
+
     def __init__(self, config):
         super().__init__(config)
         self.validator_args["exponent"] = int(self.validator_args["exponent"])
@@ -18,18 +270,48 @@ class MMD(BaseConfig):
         self.layer = self.validator_args["layer"]
         self.src_split_name = get_full_split_name("src", self.split)
         self.target_split_name = get_full_split_name("target", self.split)
+        self.create_validator()
+        if self.fused:
+            self.variants[self.get_fused_key()].add(self.get_variant())
 
+    def create_validator(self):
         self.validator = MMDValidator(
             key_map={
                 self.src_split_name: "src_train",
                 self.target_split_name: "target_train",
             },
             layer=self.validator_args["layer"],
-            batch_size=512,
+            batch_size=MMD_BATCH_SIZE,
             mmd_kwargs=self.get_mmd_kwargs(),
         )
 
+    def get_fused_key(self):
+        return (
+            self.split,
+            self.layer,
+            self.validator_args["normalize"],
+            self.per_class,
+        )
+
+    def get_variant(self):
+        bandwidth = self.get_mmd_kwargs().get("bandwidth")
+        return (self.validator_args["exponent"], bandwidth)
+
     def score(self, x, exp_config, device):
+        scores = get_fused_scores(
+            x,
+            self.src_split_name,
+            self.target_split_name,
+            self.layer,
+            device,
+            self.validator_args["normalize"],
+            self.variants[self.get_fused_key()],
+        )
+        if scores is not None:
+            return scores[self.get_variant()]
+        return self.score_unfused(x, device)
+
+    def score_unfused(self, x, device):
         return use_src_and_target(
             x,
             device,
@@ -37,20 +319,16 @@ class MMD(BaseConfig):
             self.src_split_name,
             self.target_split_name,
             self.layer,
+            self.validator_args["normalize"],
         )
 
     def expected_keys(self):
         return {"exponent", "normalize", "layer", "split"}
 
     def get_mmd_kwargs(self):
-        exponent = self.validator_args["exponent"]
-        num_kernels = (exponent * 2) + 1
-        kernel_scales = get_kernel_scales(
-            low=-exponent, high=exponent, num_kernels=num_kernels
-        )
-        dist_func = LpDistance(
-            normalize_embeddings=self.validator_args["normalize"], p=2, power=2
-        )
+        kernel_scales = get_kernel_scales_from_exponent(self.validator_args["exponent"])
+        # embeddings are normalized in score(), so they can be shared across configs
+        dist_func = LpDistance(normalize_embeddings=False, p=2, power=2)
         return {
             "kernel_scales": kernel_scales,
             "dist_func": dist_func,
@@ -58,9 +336,95 @@ class MMD(BaseConfig):
         }
 
 
+# Doesn't need the pooled distance matrix, so it's always fused.
 class MMDPerClass(MMD):
-    def __init__(self, config):
-        super().__init__(config)
+    per_class = True
+
+    def score(self, x, exp_config, device):
+        variants = {self.get_variant()}
+        if isinstance(x, EpochCache):
+            variants = self.variants[self.get_fused_key()]
+        scores = get_fused_per_class_scores(
+            x,
+            self.src_split_name,
+            self.target_split_name,
+            self.layer,
+            device,
+            self.validator_args["normalize"],
+            variants,
+        )
+        return scores[self.get_variant()]
+
+
+class MMDFixedB(MMD):
+    def get_mmd_kwargs(self):
+        kwargs = super().get_mmd_kwargs()
+        kwargs["bandwidth"] = 1
+        return kwargs
+
+
+class MMDPerClassFixedB(MMDPerClass):
+    def get_mmd_kwargs(self):
+        kwargs = super().get_mmd_kwargs()
+        kwargs["bandwidth"] = 1
+        return kwargs
+
+
+# Same as pytorch_adapt's MMDValidator, but with LinearMMDLoss.
+class LinearMMDValidator(BaseValidator):
+    def __init__(self, layer="features", mmd_kwargs=None, **kwargs):
+        super().__init__(**kwargs)
+        self.layer = layer
+        self.loss_fn = LinearMMDLoss(**mmd_kwargs)
+
+    def compute_score(self, src_train, target_train):
+        x = src_train[self.layer]
+        y = target_train[self.layer]
+        return -self.loss_fn(x, y).item()
+
+
+# Linear-time approximation of MMD, using random Fourier features
+# or the Nystrom method. See LinearMMDLoss.
+class MMDLinear(MMD):
+    fused = False
+
+    def create_validator(self):
+        self.validator = LinearMMDValidator(
+            key_map={
+                self.src_split_name: "src_train",
+                self.target_split_name: "target_train",
+            },
+            layer=self.validator_args["layer"],
+            mmd_kwargs=self.get_mmd_kwargs(),
+        )
+
+    def score(self, x, exp_config, device):
+        return use_src_and_target(
+            x,
+            device,
+            self.validator,
+            self.src_split_name,
+            self.target_split_name,
+            self.layer,
+            self.validator_args["normalize"],
+        )
+
+    def expected_keys(self):
+        return super().expected_keys() | {"method", "num_features"}
+
+    def get_mmd_kwargs(self):
+        kwargs = super().get_mmd_kwargs()
+        return {
+            "kernel_scales": kwargs["kernel_scales"],
+            "bandwidth": kwargs.get("bandwidth"),
+            "method": self.validator_args["method"],
+            "num_features": int(self.validator_args["num_features"]),
+        }
+
+
+class MMDLinearPerClass(MMDLinear):
+    def create_validator(self):
+        super().create_validator()
         self.validator = PerClassValidator(self.validator)
 
     def score(self, x, exp_config, device):
@@ -71,17 +435,18 @@ class MMDPerClass(MMD):
             self.src_split_name,
             self.target_split_name,
             self.layer,
+            self.validator_args["normalize"],
         )
 
 
-class MMDFixedB(MMD):
+class MMDLinearFixedB(MMDLinear):
     def get_mmd_kwargs(self):
         kwargs = super().get_mmd_kwargs()
         kwargs["bandwidth"] = 1
         return kwargs
 
 
-class MMDPerClassFixedB(MMDPerClass):
+class MMDLinearPerClassFixedB(MMDLinearPerClass):
     def get_mmd_kwargs(self):
         kwargs = super().get_mmd_kwargs()
         kwargs["bandwidth"] = 1
@@ -0,0 +1,40 @@
+import torch
+from pytorch_metric_learning.utils.inference import return_results
+
+
+class ProjectedBruteForceKNN:
+    """
+    knn_func for L2 distances, which does an exact (brute force) search
+    on randomly projected embeddings. The embeddings are multiplied by
+    a random Gaussian matrix, which reduces them to proj_dim dimensions while
+    approximately preserving their L2 distances. Larger proj_dim gives better
+    recall but takes longer. The search is still quadratic in the number of rows,
+    but each distance costs proj_dim instead of the embedding size,
+    so it only helps for embeddings with many more than proj_dim dimensions.
+    The projection is seeded, so the results are deterministic.
+    """
+
+    def __init__(self, proj_dim, batch_size=512, seed=0):
+        self.proj_dim = proj_dim
+        self.batch_size = batch_size
+        self.seed = seed
+
+    def __call__(self, query, k, reference, embeddings_come_from_same_source=False):
+        if embeddings_come_from_same_source:
+            k = k + 1
+        if self.proj_dim < query.shape[1]:
+            proj = self.get_projection(query)
+            query, reference = query @ proj, reference @ proj
+        distances = torch.empty(len(query), k, dtype=query.dtype, device=query.device)
+        indices = torch.empty(len(query), k, dtype=torch.long, device=query.device)
+        for s in range(0, len(query), self.batch_size):
+            e = s + self.batch_size
+            mat = torch.cdist(query[s:e], reference)
+            distances[s:e], indices[s:e] = torch.topk(mat, k, largest=False, dim=1)
+        return return_results(distances, indices, embeddings_come_from_same_source)
+
+    def get_projection(self, x):
+        g = torch.Generator().manual_seed(self.seed)
+        proj = torch.randn(x.shape[1], self.proj_dim, generator=g)
+        proj /= self.proj_dim**0.5
+        return proj.to(device=x.device, dtype=x.dtype)
@@ -0,0 +1,46 @@
+import torch
+from pytorch_metric_learning.distances import BatchedDistance, LpDistance
+
+from .base_config import get_split_and_layer
+from .epoch_cache import EpochCache
+
+
+def compute_blocked(dist_func, query, ref, batch_size):
+    output = torch.empty(len(query), len(ref), dtype=query.dtype, device=query.device)
+
+    def iter_fn(mat, s, e):
+        output[s:e] = mat
+
+    BatchedDistance(dist_func, iter_fn, batch_size)(query, ref)
+    return output
+
+
+def can_share(x, num_rows, num_cols, like):
+    if not isinstance(x, EpochCache):
+        return False
+    return x.can_cache_matrix(num_rows * num_cols * like.element_size())
+
+
+# Lp distances between all rows of cat([src, target]).
+# Used by KNN, TargetKNN and MMD configs that have the same layer and normalization.
+# Returns (matrix, number of src rows), or None if x isn't an EpochCache
+# or if the matrix is too big to cache.
+def get_pooled_distances(
+    x, src_split, target_split, layer, device, normalize, p, batch_size=512
+):
+    src = get_split_and_layer(x, src_split, layer, device, normalize, p)
+    target = get_split_and_layer(x, target_split, layer, device, normalize, p)
+    num_rows = len(src) + len(target)
+    if not can_share(x, num_rows, num_rows, src):
+        return None
+
+    def fn():
+        pooled = torch.cat([src, target], dim=0)
+        dist_func = LpDistance(normalize_embeddings=False, p=p)
+        return compute_blocked(dist_func, pooled, pooled, batch_size)
+
+    mat = x.get_or_compute(
+        ("pooled_distances", src_split, target_split, layer, str(device), normalize, p),
+        fn,
+    )
+    return mat, len(src)
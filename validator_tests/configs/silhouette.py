@@ -0,0 +1,76 @@
+import torch
+
+
+def check_number_of_labels(n_labels, n_samples):
+    # same error as sklearn, which ClassSSCentroidInit relies on
+    if not 1 < n_labels < n_samples:
+        raise ValueError(
+            f"Number of labels is {n_labels}. Valid values are 2 to n_samples - 1 (inclusive)"
+        )
+
+
+# Silhouette coefficient of each query row, measured against all rows of x.
+# Distances are computed for chunk_size queries at a time,
+# and reduced to per-cluster sums, so memory is O(chunk_size * len(x)).
+def silhouette_samples(x, labels, query_idx=None, chunk_size=1024):
+    n_clusters = int(labels.max()) + 1
+    counts = torch.bincount(labels, minlength=n_clusters).to(x.dtype)
+    one_hot = torch.nn.functional.one_hot(labels, n_clusters).to(x.dtype)
+    if query_idx is None:
+        query_idx = torch.arange(len(x), device=x.device)
+    output = torch.empty(len(query_idx), dtype=x.dtype, device=x.device)
+    for s in range(0, len(query_idx), chunk_size):
+        idx = query_idx[s : s + chunk_size]
+        cluster_sums = torch.cdist(x[idx], x) @ one_hot
+        own = labels[idx]
+        own_sums = cluster_sums.gather(1, own.unsqueeze(1)).squeeze(1)
+        own_counts = counts[own]
+        a = own_sums / (own_counts - 1).clamp(min=1)
+        mean_dists = cluster_sums / counts
+        mean_dists.scatter_(1, own.unsqueeze(1), float("inf"))
+        b = torch.min(mean_dists, dim=1)[0]
+        sil = (b - a) / torch.maximum(a, b)
+        # like sklearn, 0 for singleton clusters and for a = b = 0
+        output[s : s + chunk_size] = torch.where(
+            (own_counts > 1) & ~torch.isnan(sil), sil, torch.zeros_like(sil)
+        )
+    return output
+
+
+# Samples round(sample_size * cluster_size / len(labels)) rows from each cluster,
+# and at least one. Returns the row indices and the sampled fraction of each cluster.
+def stratified_sample(labels, sample_size, seed):
+    generator = torch.Generator().manual_seed(seed)
+    counts = torch.bincount(labels)
+    fractions = torch.zeros(len(counts), dtype=torch.float64)
+    output = []
+    for c in torch.nonzero(counts).squeeze(1).tolist():
+        rows = torch.nonzero(labels == c).squeeze(1)
+        n = int(round(sample_size * len(rows) / len(labels)))
+        n = min(max(n, 1), len(rows))
+        perm = torch.randperm(len(rows), generator=generator)[:n]
+        output.append(rows[perm.to(rows.device)])
+        fractions[c] = n / len(rows)
+    return torch.cat(output), fractions
+
+
+def silhouette_score(x, labels, sample_size=None, seed=0, chunk_size=1024):
+    """
+    Same as sklearn's silhouette_score with the euclidean metric,
+    but computed in torch on x's device, without the full distance matrix.
+    If sample_size is not None, a stratified sample of about sample_size rows
+    is scored against all rows, and each cluster's mean silhouette is weighted
+    by its size, so the estimate is unbiased. This makes the cost
+    O(sample_size * len(x)) instead of O(len(x)^2).
+    """
+    x = torch.as_tensor(x).float()
+    labels = torch.unique(
+        torch.as_tensor(labels, device=x.device), return_inverse=True
+    )[1]
+    check_number_of_labels(int(labels.max()) + 1, len(labels))
+    if sample_size is None or sample_size >= len(x):
+        return torch.mean(silhouette_samples(x, labels, chunk_size=chunk_size)).item()
+    query_idx, fractions = stratified_sample(labels, sample_size, seed)
+    sil = silhouette_samples(x, labels, query_idx, chunk_size).double()
+    weights = 1 / fractions.to(x.device)[labels[query_idx]]
+    return (torch.sum(sil * weights) / len(x)).item()
@@ -1,22 +1,58 @@
-from pytorch_adapt.validators import SNDValidator
+from collections import defaultdict
+
+import torch
+import torch.nn.functional as F
+from pytorch_adapt.layers.entropy_loss import entropy_after_softmax
 
 from .base_config import BaseConfig, get_split_and_layer
+from .epoch_cache import EpochCache
+
+
+# Same as SNDValidator.compute_score, for several temperatures at once.
+# Each block of batch_size rows of the cosine similarity matrix is computed once,
+# and used for every temperature, so peak memory is O(batch_size * N).
+# Returns one score per temperature.
+def get_snd_scores(normalized_features, temperatures, batch_size):
+    sums = torch.zeros(len(temperatures), dtype=torch.float64)
+    for s in range(0, len(normalized_features), batch_size):
+        sim_mat = normalized_features[s : s + batch_size] @ normalized_features.T
+        # excludes each row's similarity with itself,
+        # which is faster than removing it like mask_out_self does
+        sim_mat.diagonal(offset=s).fill_(-float("inf"))
+        for i, T in enumerate(temperatures):
+            preds = F.softmax(sim_mat / T, dim=1)
+            sums[i] += torch.sum(entropy_after_softmax(preds)).item()
+    return sums / len(normalized_features)
 
 
 class SND(BaseConfig):
+    # (split, layer) -> temperatures of every SND config constructed in this process.
+    # When one of them is scored, the scores of the others are computed too.
+    temperatures = defaultdict(set)
+    # number of rows of the similarity matrix computed at a time
+    batch_size = 1024
+
     def __init__(self, config):
         super().__init__(config)
         self.validator_args["T"] = float(self.validator_args["T"])
         self.layer = self.validator_args["layer"]
-        self.validator = SNDValidator(
-            key_map={self.split: "target_train"},
-            layer=self.layer,
-            T=self.validator_args["T"],
-        )
+        self.temperatures[(self.split, self.layer)].add(self.validator_args["T"])
 
     def score(self, x, exp_config, device):
-        features = get_split_and_layer(x, self.split, self.layer, device)
-        return self.validator(**{self.split: {self.layer: features}})
+        if not isinstance(x, EpochCache):
+            return self.compute_scores(x, device, (self.validator_args["T"],))[0].item()
+        temperatures = tuple(sorted(self.temperatures[(self.split, self.layer)]))
+        scores = x.get_or_compute(
+            ("snd_scores", self.split, self.layer, str(device), temperatures),
+            lambda: self.compute_scores(x, device, temperatures),
+        )
+        return scores[temperatures.index(self.validator_args["T"])].item()
+
+    def compute_scores(self, x, device, temperatures):
+        features = get_split_and_layer(
+            x, self.split, self.layer, device, normalize=True
+        )
+        return get_snd_scores(features, temperatures, self.batch_size)
 
     def expected_keys(self):
         return {"T", "layer", "split"}
@@ -0,0 +1,69 @@
+import torch
+
+
+# Exact singular values, in descending order.
+# If the SVD fails to converge (e.g. on ill-conditioned inputs, on CUDA),
+# falls back to the eigenvalues of the smaller Gram matrix, in float64 on the CPU.
+def singular_values(x):
+    try:
+        return torch.linalg.svdvals(x)
+    except RuntimeError:
+        y = x.double().cpu()
+        gram = y.T @ y if y.shape[0] >= y.shape[1] else y @ y.T
+        eigvals = torch.linalg.eigvalsh(gram).flip(0)
+        return eigvals.clamp(min=0).sqrt().to(device=x.device, dtype=x.dtype)
+
+
+# Randomized range finder with power iterations (Halko et al. 2011),
+# followed by an exact SVD of the small projected matrix.
+# Returns approximations of the largest k singular values, in descending order.
+def randomized_singular_values(x, k, n_oversamples=10, n_iter=4, seed=0):
+    rank = min(k + n_oversamples, *x.shape)
+    if rank == min(x.shape):
+        return singular_values(x)[:k]
+    generator = torch.Generator().manual_seed(seed)
+    omega = torch.randn(x.shape[1], rank, generator=generator)
+    q = torch.linalg.qr(x @ omega.to(device=x.device, dtype=x.dtype))[0]
+    for _ in range(n_iter):
+        # re-orthonormalize after each multiplication, for numerical stability
+        q = torch.linalg.qr(x.T @ q)[0]
+        q = torch.linalg.qr(x @ q)[0]
+    return singular_values(q.T @ x)[:k]
+
+
+# The singular values of x are the square roots of the eigenvalues
+# of its Gram matrix, which is much smaller when x is tall or wide.
+# The eigenvalues are computed in float64, so this matches the SVD
+# to within float32 precision, and it doesn't fail on ill-conditioned inputs.
+# If x has leading batch dimensions, one nuclear norm per matrix is returned.
+def gram_nuclear_norm(x):
+    xt = x.transpose(-2, -1)
+    gram = xt @ x if x.shape[-2] >= x.shape[-1] else x @ xt
+    eigvals = torch.linalg.eigvalsh(gram.double())
+    return torch.sum(eigvals.clamp(min=0).sqrt(), dim=-1).to(x.dtype)
+
+
+def nuclear_norm(x, tol=0, min_sample_size=1000, seed=0):
+    """
+    Returns the nuclear norm of x (the sum of its singular values).
+    If tol is 0, it is computed exactly.
+    Otherwise, it is estimated from a random sample of rows, scaled by
+    sqrt(num_rows / sample_size), so that the sample's Gram matrix estimates
+    the full one. The sample size starts at min_sample_size and doubles until
+    the estimate changes by at most tol (relative to the estimate),
+    so the cost depends on tol rather than on the number of rows.
+    This is a stopping criterion, so the actual error can be a few times tol.
+    """
+    if tol == 0:
+        return gram_nuclear_norm(x)
+    generator = torch.Generator().manual_seed(seed)
+    perm = torch.randperm(len(x), generator=generator).to(x.device)
+    sample_size, prev = min_sample_size, None
+    while sample_size < len(x):
+        sample = x[perm[:sample_size]]
+        estimate = gram_nuclear_norm(sample) * (len(x) / sample_size) ** 0.5
+        if prev is not None and abs(estimate - prev) <= tol * estimate:
+            return estimate
+        prev = estimate
+        sample_size *= 2
+    return gram_nuclear_norm(x)
@@ -1,55 +1,109 @@
 import torch
-from pytorch_adapt.layers import BatchSpectralLoss, BNMLoss
 
-from .base_config import BaseConfig, get_split_and_layer
+from .base_config import (
+    BaseConfig,
+    get_split_and_layer,
+    get_stacked_split_and_layer,
+)
+from .spectral import (
+    gram_nuclear_norm,
+    nuclear_norm,
+    randomized_singular_values,
+    singular_values,
+)
 
 
+# Same as pytorch_adapt's BatchSpectralLoss,
+# but falls back to an eigendecomposition if the SVD fails.
 class BSP(BaseConfig):
     def __init__(self, config):
         super().__init__(config)
         self.validator_args["k"] = int(self.validator_args["k"])
         self.layer = self.validator_args["layer"]
-        self.validator = BatchSpectralLoss(k=self.validator_args["k"])
 
     def score(self, x, exp_config, device):
         features = get_split_and_layer(x, self.split, self.layer, device)
-        try:
-            return -self.validator(features).item()
-        except RuntimeError as e:
-            if "svd_cuda" in str(e):
-                return float("nan")
-            raise
+        top_k = self.get_singular_values(features)
+        return -torch.sum(top_k**2).item()
+
+    def get_singular_values(self, features):
+        return singular_values(features)[: self.validator_args["k"]]
 
     def expected_keys(self):
         return {"k", "split", "layer"}
 
 
+# Only computes the top k singular values, with randomized SVD.
+class BSPApprox(BSP):
+    def __init__(self, config):
+        super().__init__(config)
+        self.validator_args["n_iter"] = int(self.validator_args["n_iter"])
+
+    def get_singular_values(self, features):
+        return randomized_singular_values(
+            features, self.validator_args["k"], n_iter=self.validator_args["n_iter"]
+        )
+
+    def expected_keys(self):
+        return super().expected_keys() | {"n_iter"}
+
+
+# Same as pytorch_adapt's BNMLoss,
+# but the nuclear norm is computed from the Gram matrix of the preds.
 class BNM(BaseConfig):
+    batched = True
+
     def __init__(self, config):
         super().__init__(config)
         self.layer = self.validator_args["layer"]
-        self.validator = BNMLoss()
 
     def score(self, x, exp_config, device):
         features = get_split_and_layer(x, self.split, self.layer, device)
-        return -self.validator(features).item()
+        preds = torch.nn.functional.softmax(features, dim=1)
+        return (nuclear_norm(preds, self.get_tol()) / len(preds)).item()
+
+    def score_epochs(self, x, exp_config, device):
+        features = get_stacked_split_and_layer(x, self.split, self.layer, device)
+        preds = torch.nn.functional.softmax(features, dim=-1)
+        return gram_nuclear_norm(preds) / preds.shape[1]
+
+    def get_tol(self):
+        return 0
 
     def expected_keys(self):
         return {"split", "layer"}
 
 
+# Estimates the nuclear norm from a sample of rows.
+class BNMApprox(BNM):
+    batched = False
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.validator_args["tol"] = float(self.validator_args["tol"])
+
+    def get_tol(self):
+        return self.validator_args["tol"]
+
+    def expected_keys(self):
+        return super().expected_keys() | {"tol"}
+
+
 # from https://github.com/cuishuhao/BNM
 # TODO: move to pytorch-adapt
+# X can have leading batch dimensions, e.g. (epochs, N, C).
 def FBNM_loss(X):
-    X = torch.nn.functional.softmax(X, dim=1)
+    X = torch.nn.functional.softmax(X, dim=-1)
     list_svd, _ = torch.sort(
-        torch.sqrt(torch.sum(torch.pow(X, 2), dim=0)), descending=True
+        torch.sqrt(torch.sum(torch.pow(X, 2), dim=-2)), descending=True
     )
-    nums = min(X.shape[0], X.shape[1])
-    return -torch.sum(list_svd[:nums])
+    nums = min(X.shape[-2], X.shape[-1])
+    return -torch.sum(list_svd[..., :nums], dim=-1)
 
 
 class FBNM(BaseConfig):
+    batched = True
+
     def __init__(self, config):
         super().__init__(config)
         self.layer = self.validator_args["layer"]
@@ -58,5 +112,9 @@ class FBNM(BaseConfig):
         features = get_split_and_layer(x, self.split, self.layer, device)
         return -FBNM_loss(features).item()
 
+    def score_epochs(self, x, exp_config, device):
+        features = get_stacked_split_and_layer(x, self.split, self.layer, device)
+        return -FBNM_loss(features)
+
     def expected_keys(self):
         return {"split", "layer"}
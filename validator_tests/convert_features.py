@@ -0,0 +1,57 @@
+import argparse
+import glob
+import os
+import sys
+
+sys.path.insert(0, ".")
+
+from powerful_benchmarker.utils.constants import add_default_args
+from validator_tests.utils import utils
+from validator_tests.utils.constants import add_exp_group_args
+from validator_tests.utils.stacked_features import (
+    convert_to_stacked,
+    get_stacked_features_filepath,
+    is_stacked_up_to_date,
+)
+
+
+def convert_folder(folder, overwrite):
+    features_file = utils.get_features_filepath(folder)
+    stacked_file = get_stacked_features_filepath(folder)
+    if not os.path.isfile(features_file):
+        return
+    try:
+        if is_stacked_up_to_date(stacked_file, features_file) and not overwrite:
+            print("skipping", stacked_file)
+            return
+        print("converting", features_file)
+        skipped = convert_to_stacked(features_file, stacked_file)
+    except BlockingIOError:
+        # the training process still has the file open for writing
+        print("skipping, because it is still being written:", features_file)
+        return
+    if len(skipped) > 0:
+        print("not stacked because they differ between epochs:", skipped)
+
+
+def main(cfg):
+    exp_groups = utils.get_exp_groups(cfg)
+    for exp_group in exp_groups:
+        exp_group_path = os.path.join(cfg.exp_folder, exp_group)
+        for exp_path in sorted(glob.glob(os.path.join(exp_group_path, "*"))):
+            if not os.path.isdir(exp_path):
+                continue
+            exp_name = os.path.basename(exp_path)
+            # only trials that are COMPLETE in trials.csv,
+            # so trials that are still training are skipped
+            for folder in utils.get_exp_folders(exp_group_path, exp_name):
+                convert_folder(folder, cfg.overwrite)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+    add_default_args(parser, ["exp_folder"])
+    add_exp_group_args(parser)
+    parser.add_argument("--overwrite", action="store_true")
+    args = parser.parse_args()
+    main(args)
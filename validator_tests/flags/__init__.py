@@ -4,13 +4,30 @@ from .cluster import (
     ClassAMICentroidInit,
     ClassSS,
     ClassSSCentroidInit,
+    ClassSSCentroidInitSampled,
+    ClassSSSampled,
     DomainCluster,
 )
-from .dev import DEV, DEVBinary
+from .dev import DEV, DEVBinary, DEVLinear, DEVLinearBinary
 from .diversity import Diversity
 from .dlogits_accuracy import DLogitsAccuracy
 from .entropy import Entropy
-from .knn import KNN, TargetKNN, TargetKNNLogits
-from .mmd import MMD, MMDFixedB, MMDPerClass, MMDPerClassFixedB
+from .knn import (
+    KNN,
+    KNNProjected,
+    TargetKNN,
+    TargetKNNLogits,
+    TargetKNNProjected,
+)
+from .mmd import (
+    MMD,
+    MMDFixedB,
+    MMDLinear,
+    MMDLinearFixedB,
+    MMDLinearPerClass,
+    MMDLinearPerClassFixedB,
+    MMDPerClass,
+    MMDPerClassFixedB,
+)
 from .snd import SND
-from .svd import BNM, BSP, FBNM
+from .svd import BNM, BSP, FBNM, BNMApprox, BSPApprox
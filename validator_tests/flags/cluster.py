@@ -53,3 +53,21 @@ def ClassSSCentroidInit():
     for f in flags:
         f["validator"] = "ClassSSCentroidInit"
     return flags
+
+
+def add_sample_size_args(flags, validator):
+    output = []
+    for f in flags:
+        for sample_size in [1000, 5000]:
+            output.append(
+                {**f, "validator": validator, "sample_size": str(sample_size)}
+            )
+    return output
+
+
+def ClassSSSampled():
+    return add_sample_size_args(ClassAMI(), "ClassSSSampled")
+
+
+def ClassSSCentroidInitSampled():
+    return add_sample_size_args(ClassAMI(), "ClassSSCentroidInitSampled")
@@ -13,3 +13,25 @@ def DEVBinary():
     for f in flags:
         f["validator"] = "DEVBinary"
     return flags
+
+
+def DEVLinear():
+    flags = []
+    for f in DEV():
+        for method, warm_start in [("lda", 0), ("lbfgs", 0), ("lbfgs", 1)]:
+            flags.append(
+                {
+                    **f,
+                    "validator": "DEVLinear",
+                    "method": method,
+                    "warm_start": str(warm_start),
+                }
+            )
+    return flags
+
+
+def DEVLinearBinary():
+    flags = DEVLinear()
+    for f in flags:
+        f["validator"] = "DEVLinearBinary"
+    return flags
@@ -41,3 +41,23 @@ def TargetKNNLogits():
     for f in flags:
         f["validator"] = "TargetKNNLogits"
     return flags
+
+
+# Only for the features layer. The logits and preds layers have at most 65 dimensions,
+# so the projected configs would mostly be the same as the exact ones.
+def add_projected_args(flags, validator):
+    output = []
+    for f in flags:
+        if f.get("layer", "features") != "features":
+            continue
+        for proj_dim in [32, 128]:
+            output.append({**f, "validator": validator, "proj_dim": str(proj_dim)})
+    return output
+
+
+def KNNProjected():
+    return add_projected_args(KNN(), "KNNProjected")
+
+
+def TargetKNNProjected():
+    return add_projected_args(TargetKNN(), "TargetKNNProjected")
@@ -34,3 +34,35 @@ def MMDPerClassFixedB():
     for f in flags:
         f["validator"] = "MMDPerClassFixedB"
     return flags
+
+
+def add_linear_args(flags, validator):
+    output = []
+    for f in flags:
+        for method in ["rff", "nystrom"]:
+            for num_features in [1024]:
+                output.append(
+                    {
+                        **f,
+                        "validator": validator,
+                        "method": method,
+                        "num_features": str(num_features),
+                    }
+                )
+    return output
+
+
+def MMDLinear():
+    return add_linear_args(MMD(), "MMDLinear")
+
+
+def MMDLinearPerClass():
+    return add_linear_args(MMD(), "MMDLinearPerClass")
+
+
+def MMDLinearFixedB():
+    return add_linear_args(MMD(), "MMDLinearFixedB")
+
+
+def MMDLinearPerClassFixedB():
+    return add_linear_args(MMD(), "MMDLinearPerClassFixedB")
@@ -21,3 +21,19 @@ def FBNM():
     for f in flags:
         f["validator"] = "FBNM"
     return flags
+
+
+def BSPApprox():
+    flags = []
+    for f in BSP():
+        for n_iter in ["2", "4"]:
+            flags.append({**f, "validator": "BSPApprox", "n_iter": n_iter})
+    return flags
+
+
+def BNMApprox():
+    flags = []
+    for f in BNM():
+        for tol in ["0.01", "0.001"]:
+            flags.append({**f, "validator": "BNMApprox", "tol": tol})
+    return flags
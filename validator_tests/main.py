@@ -19,7 +19,8 @@ from pytorch_adapt.utils import common_functions as c_f
 from powerful_benchmarker.utils.constants import add_default_args
 from powerful_benchmarker.utils.utils import convert_unknown_args
 from validator_tests import configs
-from validator_tests.utils import utils
+from validator_tests import flags as flags_module
+from validator_tests.utils import costs, prefetch, utils
 from validator_tests.utils.constants import VALIDATOR_TESTS_FOLDER
 
 tqdm.__init__ = partialmethod(tqdm.__init__, disable=True)
@@ -33,24 +34,75 @@ def assert_curr_dict(curr_dict):
         raise KeyError("curr_dict already has some validation related keys")
 
 
-def save_df(validator_name, validator_args_str, all_scores):
+# With --record_costs, each score's costs are stored under this key,
+# so that they reach collect_scores from worker processes and partial scores.
+COSTS_KEY = "_costs"
+RECORD_COSTS_HELP = (
+    "Save the costs of each config and epoch in a .costs.csv file next to the pkl. "
+    "Configs scored on the same epoch share cached work (e.g. decoded features, "
+    "distance matrices, cluster labels, SND and MMD scores). "
+    "Shared work is charged to the config that computes it first: "
+    "wall_time and cpu_time are what each config actually spent, "
+    "shared_time is the part of wall_time spent on work that later configs can reuse, "
+    "and reused_time is the time that earlier configs spent on the work "
+    "that this config reused (num_reused cached tensors). "
+    "wall_time + reused_time estimates the wall time of a config scored on its own. "
+    "Input sizes include the inputs of reused work."
+)
+
+
+def save_df(validator_name, validator_args_str, all_scores, all_costs):
     def fn(folder):
         df = pd.DataFrame(all_scores)
         filepath = utils.get_df_filepath(folder, validator_name, validator_args_str)
         df.to_pickle(filepath)
         all_scores.clear()
+        if len(all_costs) > 0:
+            pd.DataFrame(all_costs).to_csv(
+                utils.get_costs_filepath(folder, validator_name, validator_args_str),
+                index=False,
+            )
+            all_costs.clear()
+        utils.delete_partial_scores(folder, validator_name, validator_args_str)
 
     return fn
 
 
-def get_and_save_scores(
+# Calls score_fn(x), and if record_costs is True, also returns its costs row.
+# x is wrapped in an EpochCache if it isn't one, to record the input shapes.
+# Work shared through the EpochCache is charged to the config that computes it,
+# and the configs that reuse it record how long it took (see RECORD_COSTS_HELP).
+def score_with_costs(score_fn, x, record_costs, cost_row_fn):
+    if not record_costs:
+        return score_fn(x), None
+    if not isinstance(x, configs.EpochCache):
+        x = configs.EpochCache(x)
+    x.record_costs = True
+    x.reset_costs()
+    output, curr_costs = costs.measure(lambda: score_fn(x), DEVICE)
+    curr_costs.update(
+        {
+            "shared_time": x.shared_time,
+            "reused_time": x.get_reused_time(),
+            "num_reused": x.get_num_reused(),
+        }
+    )
+    return output, cost_row_fn(curr_costs, x.input_shapes)
+
+
+def get_scores(
     validator_name,
     validator,
     validator_args_str,
-    all_scores,
     skip_validator_errors,
+    record_costs=False,
 ):
     def fn(epoch, x, exp_config, exp_folder):
+        curr_dict = utils.load_partial_score(
+            exp_folder, validator_name, validator_args_str, epoch
+        )
+        if curr_dict is not None:
+            return curr_dict
         if isinstance(validator, configs.DEV):
             # temporarily appending epoch to folder name
             # because of folder deletion problem
@@ -63,9 +115,27 @@ def get_and_save_scores(
             # temporarily disabling this
             # if os.path.isdir(temp_folder):
             # shutil.rmtree(temp_folder)  # delete any old copies
+
+        def cost_row_fn(curr_costs, input_shapes):
+            return costs.get_costs_row(
+                validator_name,
+                validator_args_str,
+                curr_costs,
+                input_shapes,
+                exp_config,
+                exp_folder,
+                epoch,
+                DEVICE,
+            )
+
         error_was_raised = False
         try:
-            score = validator.score(x, exp_config, DEVICE)
+            score, curr_costs = score_with_costs(
+                lambda y: validator.score(y, exp_config, DEVICE),
+                x,
+                record_costs,
+                cost_row_fn,
+            )
         except Exception as e:
             if skip_validator_errors:
                 error_was_raised = True
@@ -77,24 +147,141 @@ def get_and_save_scores(
                 raise
 
         if skip_validator_errors and error_was_raised:
-            return
-
-        curr_dict = copy.deepcopy(exp_config)
-        assert_curr_dict(curr_dict)
-        curr_dict["trial_params"] = utils.dict_to_str(curr_dict["trial_params"])
-        curr_dict["epoch"] = epoch
-        curr_dict.update(
-            {
-                "validator": validator_name,
-                "validator_args": validator_args_str,
-                "score": score,
-            }
+            return None
+
+        curr_dict = get_exp_dict(exp_config)
+        add_score(curr_dict, epoch, validator_name, validator_args_str, score)
+        if curr_costs is not None:
+            curr_dict[COSTS_KEY] = curr_costs
+        utils.save_partial_score(
+            exp_folder, validator_name, validator_args_str, epoch, curr_dict
         )
-        all_scores.append(curr_dict)
+        return curr_dict
 
     return fn
 
 
+def get_exp_dict(exp_config):
+    curr_dict = copy.deepcopy(exp_config)
+    assert_curr_dict(curr_dict)
+    curr_dict["trial_params"] = utils.dict_to_str(curr_dict["trial_params"])
+    return curr_dict
+
+
+def add_score(curr_dict, epoch, validator_name, validator_args_str, score):
+    curr_dict["epoch"] = epoch
+    curr_dict.update(
+        {
+            "validator": validator_name,
+            "validator_args": validator_args_str,
+            "score": score,
+        }
+    )
+
+
+# For configs with batched = True.
+# Scores several epochs with one score_epochs call, and returns one row per epoch.
+# exp_config is only copied once, because the rows of a trial can share its values.
+# Partial scores aren't saved, because a whole trial takes a fraction of a second.
+def get_batched_scores(
+    validator_name,
+    validator,
+    validator_args_str,
+    skip_validator_errors,
+    record_costs=False,
+):
+    def fn(epochs, x, exp_config, exp_folder):
+        def cost_row_fn(curr_costs, input_shapes):
+            return [
+                costs.get_costs_row(
+                    validator_name,
+                    validator_args_str,
+                    curr_costs,
+                    input_shapes,
+                    exp_config,
+                    exp_folder,
+                    epoch,
+                    DEVICE,
+                    batch_size=len(epochs),
+                )
+                for epoch in epochs
+            ]
+
+        try:
+            scores, curr_costs = score_with_costs(
+                lambda y: validator.score_epochs(y, exp_config, DEVICE).tolist(),
+                x,
+                record_costs,
+                cost_row_fn,
+            )
+        except Exception as e:
+            if not skip_validator_errors:
+                raise
+            c_f.LOGGER.info(e)
+            c_f.LOGGER.info(
+                "Ignoring validator exception because skip_validator_errors is True"
+            )
+            return []
+        exp_dict = get_exp_dict(exp_config)
+        output = []
+        for i, (epoch, score) in enumerate(zip(epochs, scores)):
+            curr_dict = dict(exp_dict)
+            add_score(curr_dict, epoch, validator_name, validator_args_str, score)
+            if curr_costs is not None:
+                curr_dict[COSTS_KEY] = curr_costs[i]
+            output.append(curr_dict)
+        return output
+
+    return fn
+
+
+def collect_scores(all_scores, all_costs):
+    def fn(curr_dict):
+        if curr_dict is not None:
+            curr_costs = curr_dict.pop(COSTS_KEY, None)
+            if curr_costs is not None:
+                all_costs.append(curr_costs)
+            all_scores.append(curr_dict)
+
+    return fn
+
+
+def collect_batched_scores(all_scores, all_costs):
+    collect_fn = collect_scores(all_scores, all_costs)
+
+    def fn(rows):
+        for curr_dict in rows:
+            collect_fn(curr_dict)
+
+    return fn
+
+
+def score_and_collect(score_fn, collect_fn):
+    def fn(*args):
+        collect_fn(score_fn(*args))
+
+    return fn
+
+
+def get_and_save_scores(
+    validator_name,
+    validator,
+    validator_args_str,
+    all_scores,
+    all_costs,
+    skip_validator_errors,
+    record_costs=False,
+):
+    score_fn = get_scores(
+        validator_name,
+        validator,
+        validator_args_str,
+        skip_validator_errors,
+        record_costs,
+    )
+    return score_and_collect(score_fn, collect_scores(all_scores, all_costs))
+
+
 def get_validator_and_condition_fn(
     validator_name, validator_args, trial_range, exp_folder, exp_group, exp_name
 ):
@@ -107,6 +294,132 @@ def get_validator_and_condition_fn(
     return validator, validator_args_str, exp_folders, condition_fn
 
 
+def get_validators_from_flags(flag_names):
+    output = []
+    for flag_name in flag_names:
+        for f in getattr(flags_module, flag_name)():
+            f = copy.deepcopy(f)
+            validator_name = f.pop("validator")
+            output.append((validator_name, f))
+    return output
+
+
+# distance matrices are only worth caching when several configs share them,
+# so distance_cache_mb is 0 when a single validator is run
+def get_read_epoch_fn(epoch_cache_mb, distance_cache_mb):
+    max_bytes = None if epoch_cache_mb is None else int(epoch_cache_mb * 1e6)
+    max_matrix_bytes = int(distance_cache_mb * 1e6)
+
+    def fn(x):
+        return configs.EpochCache(x, max_bytes, max_matrix_bytes)
+
+    return fn
+
+
+def use_batched(validator, args):
+    return validator.batched and args.epoch_batch_size > 0
+
+
+def main_batched(args, batched):
+    conditions, fns, end_fns = [], [], []
+    for validator_name, validator, validator_args_str, condition_fn in batched:
+        all_scores, all_costs = [], []
+        conditions.append(condition_fn)
+        fn = get_batched_scores(
+            validator_name,
+            validator,
+            validator_args_str,
+            args.skip_validator_errors,
+            args.record_costs,
+        )
+        fns.append(score_and_collect(fn, collect_batched_scores(all_scores, all_costs)))
+        end_fns.append(
+            save_df(validator_name, validator_args_str, all_scores, all_costs)
+        )
+    if len(fns) == 0:
+        return
+    exp_folders = utils.get_exp_folders(
+        os.path.join(args.exp_folder, args.exp_group), args.exp_name
+    )
+    utils.apply_to_data_batched(
+        exp_folders,
+        conditions,
+        fns,
+        end_fns,
+        args.epoch_batch_size,
+        get_read_epoch_fn(args.epoch_cache_mb, 0),
+    )
+
+
+def main_multiple(args):
+    conditions, fns, collect_fns, end_fns = [], [], [], []
+    batched = []
+    for validator_name, validator_args in get_validators_from_flags(args.flags):
+        (
+            validator,
+            validator_args_str,
+            exp_folders,
+            condition_fn,
+        ) = get_validator_and_condition_fn(
+            validator_name,
+            validator_args,
+            args.trial_range,
+            args.exp_folder,
+            args.exp_group,
+            args.exp_name,
+        )
+        if use_batched(validator, args):
+            batched.append(
+                (validator_name, validator, validator_args_str, condition_fn)
+            )
+            continue
+        all_scores, all_costs = [], []
+        conditions.append(condition_fn)
+        fns.append(
+            get_scores(
+                validator_name,
+                validator,
+                validator_args_str,
+                args.skip_validator_errors,
+                args.record_costs,
+            )
+        )
+        collect_fns.append(collect_scores(all_scores, all_costs))
+        end_fns.append(
+            save_df(validator_name, validator_args_str, all_scores, all_costs)
+        )
+    if len(fns) > 0:
+        main_unbatched(args, exp_folders, conditions, fns, collect_fns, end_fns)
+    # After the unbatched configs, because their worker processes are forked,
+    # and can't use CUDA once the batched pass has initialized it.
+    main_batched(args, batched)
+
+
+def main_unbatched(args, exp_folders, conditions, fns, collect_fns, end_fns):
+    read_epoch_fn = get_read_epoch_fn(args.epoch_cache_mb, args.distance_cache_mb)
+    if args.num_workers > 0:
+        utils.apply_to_data_parallel(
+            exp_folders,
+            conditions,
+            fns,
+            collect_fns,
+            end_fns,
+            args.num_workers,
+            args.torch_threads,
+            read_epoch_fn=read_epoch_fn,
+        )
+    elif args.prefetch > 0:
+        fns = [score_and_collect(f, c) for f, c in zip(fns, collect_fns)]
+        prefetch.apply_to_data_prefetched(
+            exp_folders, conditions, fns, end_fns, args.prefetch, read_epoch_fn
+        )
+    else:
+        fns = [score_and_collect(f, c) for f, c in zip(fns, collect_fns)]
+        utils.apply_to_data_multiple(
+            exp_folders, conditions, fns, end_fns, read_epoch_fn=read_epoch_fn
+        )
+
+
 def main(args, validator_args):
     (
         validator,
@@ -121,16 +434,52 @@ def main(args, validator_args):
         args.exp_group,
         args.exp_name,
     )
-    all_scores = []
+    if use_batched(validator, args):
+        main_batched(
+            args, [(args.validator, validator, validator_args_str, condition_fn)]
+        )
+        return
+    all_scores, all_costs = [], []
+    end_fn = save_df(args.validator, validator_args_str, all_scores, all_costs)
+    if args.num_workers > 0:
+        fn = get_scores(
+            args.validator,
+            validator,
+            validator_args_str,
+            args.skip_validator_errors,
+            args.record_costs,
+        )
+        utils.apply_to_data_parallel(
+            exp_folders,
+            [condition_fn],
+            [fn],
+            [collect_scores(all_scores, all_costs)],
+            [end_fn],
+            args.num_workers,
+            args.torch_threads,
+            read_epoch_fn=get_read_epoch_fn(args.epoch_cache_mb, 0),
+        )
+        return
     fn = get_and_save_scores(
         args.validator,
         validator,
         validator_args_str,
         all_scores,
+        all_costs,
         args.skip_validator_errors,
+        args.record_costs,
     )
-    end_fn = save_df(args.validator, validator_args_str, all_scores)
-    utils.apply_to_data(exp_folders, condition_fn, fn, end_fn)
+    if args.prefetch > 0:
+        prefetch.apply_to_data_prefetched(
+            exp_folders,
+            [condition_fn],
+            [fn],
+            [end_fn],
+            args.prefetch,
+            get_read_epoch_fn(args.epoch_cache_mb, 0),
+        )
+    else:
+        utils.apply_to_data(exp_folders, condition_fn, fn, end_fn)
 
 
 if __name__ == "__main__":
@@ -138,9 +487,23 @@ if __name__ == "__main__":
     add_default_args(parser, ["exp_folder"])
     parser.add_argument("--exp_group", type=str, required=True)
     parser.add_argument("--exp_name", type=str, required=True)
-    parser.add_argument("--validator", type=str, required=True)
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--validator", type=str)
+    group.add_argument("--flags", nargs="+", type=str)
     parser.add_argument("--trial_range", nargs="+", type=int, default=[])
     parser.add_argument("--skip_validator_errors", action="store_true")
+    parser.add_argument("--epoch_cache_mb", type=float, default=None)
+    parser.add_argument("--distance_cache_mb", type=float, default=2000)
+    parser.add_argument("--snd_batch_size", type=int, default=1024)
+    parser.add_argument("--epoch_batch_size", type=int, default=16)
+    parser.add_argument("--num_workers", type=int, default=0)
+    parser.add_argument("--torch_threads", type=int, default=1)
+    parser.add_argument("--prefetch", type=int, default=0)
+    parser.add_argument("--record_costs", action="store_true", help=RECORD_COSTS_HELP)
     args, unknown_args = parser.parse_known_args()
-    validator_args = convert_unknown_args(unknown_args)
-    main(args, validator_args)
+    configs.SND.batch_size = args.snd_batch_size
+    if args.flags:
+        main_multiple(args)
+    else:
+        validator_args = convert_unknown_args(unknown_args)
+        main(args, validator_args)
@@ -0,0 +1,47 @@
+import argparse
+import glob
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, ".")
+from powerful_benchmarker.utils.constants import add_default_args
+from validator_tests.utils import costs, utils
+from validator_tests.utils.constants import VALIDATOR_TESTS_FOLDER, add_exp_group_args
+
+
+def get_costs_files(exp_folder, exp_group):
+    return glob.glob(
+        os.path.join(
+            exp_folder, exp_group, "*", "*", VALIDATOR_TESTS_FOLDER, "*.costs.csv"
+        )
+    )
+
+
+def main(args):
+    filepaths = []
+    for exp_group in utils.get_exp_groups(args):
+        filepaths.extend(get_costs_files(args.exp_folder, exp_group))
+    if len(filepaths) == 0:
+        print("no costs files found. Run main.py with --record_costs first")
+        return
+    df = costs.read_costs_files(filepaths)
+    group_by = ["validator", "dataset"]
+    if args.by_validator_args:
+        group_by.insert(1, "validator_args")
+    summary = costs.summarize_costs(df, group_by)
+    with pd.option_context("display.max_colwidth", None, "display.width", None):
+        print(summary.to_string(index=False))
+    if args.output:
+        summary.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(allow_abbrev=False)
+    add_default_args(parser, ["exp_folder"])
+    add_exp_group_args(parser)
+    parser.add_argument("--by_validator_args", action="store_true")
+    parser.add_argument("--output", type=str, default=None)
+    args = parser.parse_args()
+    main(args)
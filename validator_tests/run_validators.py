@@ -114,6 +114,11 @@ def remove_completed_flags(flags, trial_ranges, exp_folder, exp_group, exp_name)
     return keep_flags
 
 
+def single_pass_flags_to_strs(flags_name, flags):
+    trial_ranges = sorted(set(tuple(f["trial_range"]) for f in flags))
+    return [f"--flags {flags_name} --trial_range {t[0]} {t[1]}" for t in trial_ranges]
+
+
 def no_duplicates(x):
     return len(x) == len(set(x))
 
@@ -133,7 +138,10 @@ def launcher(args, slurm_args, exp_groups):
             flags = remove_completed_flags(
                 flags, trial_ranges, args.exp_folder, exp_group, exp_name
             )
-            flags = flags_to_strs(flags)
+            if args.single_pass:
+                flags = single_pass_flags_to_strs(args.flags, flags)
+            else:
+                flags = flags_to_strs(flags)
             commands = [f"{base_command} {x}" for x in flags]
             to_run.extend(commands)
 
@@ -165,6 +173,7 @@ if __name__ == "__main__":
     parser.add_argument("--exp_per_slurm_job", type=int, required=True)
     parser.add_argument("--slurm_config", type=str, required=True)
     parser.add_argument("--skip_validator_errors", action="store_true")
+    parser.add_argument("--single_pass", action="store_true")
     parser.add_argument("--run", action="store_true")
     args, unknown_args = parser.parse_known_args()
     slurm_args = create_slurm_args(args, unknown_args, "validator_tests")
@@ -0,0 +1,50 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+
+from . import utils
+
+DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+
+# Returns the score and the time it took, waiting for any CUDA kernels to finish.
+def timed_score(validator, x, exp_config):
+    s = time.perf_counter()
+    score = validator.score(x, exp_config, DEVICE)
+    if DEVICE.type == "cuda":
+        torch.cuda.synchronize()
+    return score, time.perf_counter() - s
+
+
+# The complete trials of exp_group/exp_name.
+# trial_range is passed to np.arange, and indices past the last trial are ignored.
+def get_trial_folders(exp_folder, exp_group, exp_name, trial_range):
+    exp_folders = utils.get_exp_folders(os.path.join(exp_folder, exp_group), exp_name)
+    if trial_range == []:
+        return exp_folders
+    return [exp_folders[i] for i in np.arange(*trial_range) if i < len(exp_folders)]
+
+
+# For each group, compares the "score" column with the other_score column
+# across all checkpoints: their Spearman correlation, their largest difference,
+# and whether they pick the same best checkpoint.
+# extra_fn(x) can return more columns for each group.
+def summarize_score_pairs(df, other_score, group_by, extra_fn=None):
+    def fn(x):
+        best = x.loc[x["score"].idxmax()]
+        best_other = x.loc[x[other_score].idxmax()]
+        output = {
+            "spearman": x["score"].corr(x[other_score], method="spearman"),
+            "max_abs_diff": (x["score"] - x[other_score]).abs().max(),
+            "same_best": (best["exp_folder"], best["epoch"])
+            == (best_other["exp_folder"], best_other["epoch"]),
+        }
+        if extra_fn:
+            output.update(extra_fn(x))
+        output["num_checkpoints"] = len(x)
+        return pd.Series(output)
+
+    return df.groupby(group_by).apply(fn).reset_index()
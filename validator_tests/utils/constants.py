@@ -1,5 +1,6 @@
 JOBIDS_FILENAME = "all_validator_jobids.json"
 VALIDATOR_TESTS_FOLDER = "validator_tests"
+PARTIAL_SCORES_FOLDER = "partial"
 ALL_DFS_FILENAME = "all_dfs.pkl"
 PER_SRC_FILENAME = "per_src_threshold.pkl"
 PER_SRC_PER_ADAPTER_FILENAME = "per_src_threshold_per_adapter.pkl"
@@ -0,0 +1,119 @@
+import json
+import resource
+import time
+
+import pandas as pd
+import torch
+
+
+# The peak resident set size of this process so far.
+# It can't be reset, so it's an upper bound on the memory used by the latest call.
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Calls fn and returns (output, costs).
+# peak_cuda_mb is the peak memory allocated by PyTorch during the call.
+def measure(fn, device):
+    is_cuda = device.type == "cuda"
+    if is_cuda:
+        torch.cuda.synchronize(device)
+        torch.cuda.reset_peak_memory_stats(device)
+    wall_time, cpu_time = time.perf_counter(), time.process_time()
+    output = fn()
+    if is_cuda:
+        torch.cuda.synchronize(device)
+    costs = {
+        "wall_time": time.perf_counter() - wall_time,
+        "cpu_time": time.process_time() - cpu_time,
+        "peak_rss_mb": peak_rss_mb(),
+        "peak_cuda_mb": (
+            torch.cuda.max_memory_allocated(device) / 1e6 if is_cuda else float("nan")
+        ),
+    }
+    return output, costs
+
+
+# input_shapes maps "inference/<split>/<layer>" to a shape,
+# which starts with num_leading batch dimensions (e.g. epochs).
+# Returns (total number of rows of the splits, widest 2D input).
+def get_input_size(input_shapes, num_leading=0):
+    rows, num_dims = {}, 0
+    for name, shape in input_shapes.items():
+        shape = shape[num_leading:]
+        if len(shape) == 0:
+            continue
+        split = name.split("/")[1]
+        rows[split] = max(rows.get(split, 0), shape[0])
+        if len(shape) > 1:
+            num_dims = max(num_dims, shape[1])
+    return sum(rows.values()), num_dims
+
+
+# One row of a costs file. batch_size is the number of epochs scored
+# by a batched config (see BaseConfig.score_epochs), or None.
+# The costs of a batch of epochs are split evenly.
+def get_costs_row(
+    validator_name,
+    validator_args_str,
+    costs,
+    input_shapes,
+    exp_config,
+    exp_folder,
+    epoch,
+    device,
+    batch_size=None,
+):
+    num_rows, num_dims = get_input_size(input_shapes, int(batch_size is not None))
+    batch_size = batch_size or 1
+    return {
+        "validator": validator_name,
+        "validator_args": validator_args_str,
+        "exp_folder": exp_folder,
+        "dataset": exp_config["dataset"],
+        "epoch": epoch,
+        "device": device.type,
+        "batch_size": batch_size,
+        "wall_time": costs["wall_time"] / batch_size,
+        "cpu_time": costs["cpu_time"] / batch_size,
+        "shared_time": costs["shared_time"] / batch_size,
+        "reused_time": costs["reused_time"] / batch_size,
+        "num_reused": costs["num_reused"],
+        "peak_rss_mb": costs["peak_rss_mb"],
+        "peak_cuda_mb": costs["peak_cuda_mb"],
+        "num_rows": num_rows,
+        "num_dims": num_dims,
+        "input_shapes": json.dumps(input_shapes, sort_keys=True),
+    }
+
+
+# Aggregates costs files into one row per group.
+# Times are per epoch, except for the totals.
+# standalone_time is wall_time + reused_time, i.e. it includes the shared work
+# that other configs computed, as if the config had been scored on its own.
+def summarize_costs(df, group_by=("validator", "dataset")):
+    df = df.assign(standalone_time=df["wall_time"] + df["reused_time"])
+    return (
+        df.groupby(list(group_by))
+        .agg(
+            num_epochs=("wall_time", "size"),
+            wall_time_mean=("wall_time", "mean"),
+            wall_time_max=("wall_time", "max"),
+            wall_time_total=("wall_time", "sum"),
+            cpu_time_total=("cpu_time", "sum"),
+            shared_time_total=("shared_time", "sum"),
+            reused_time_total=("reused_time", "sum"),
+            standalone_time_mean=("standalone_time", "mean"),
+            standalone_time_total=("standalone_time", "sum"),
+            peak_rss_mb=("peak_rss_mb", "max"),
+            peak_cuda_mb=("peak_cuda_mb", "max"),
+            num_rows=("num_rows", "max"),
+            num_dims=("num_dims", "max"),
+        )
+        .reset_index()
+        .sort_values("wall_time_total", ascending=False)
+    )
+
+
+def read_costs_files(filepaths):
+    return pd.concat([pd.read_csv(f) for f in filepaths], axis=0, ignore_index=True)
@@ -98,6 +98,10 @@ def drop_irrelevant_columns(df):
             "use_full_inference",
             "exp_validator",
         ]
+    ).drop(
+        # storage options added later, so older runs don't have them
+        columns=["async_save_features", "feature_compression", "feature_dtype"],
+        errors="ignore",
     )
 
 
@@ -0,0 +1,53 @@
+import h5py
+
+from powerful_benchmarker.utils.feature_writer import (
+    EPOCH_INVARIANT_ATTR,
+    EPOCH_INVARIANT_KEYS,
+)
+
+
+# Returns the path of the dataset that holds the value of x[key],
+# if it is an epoch invariant dataset written by FeatureWriter.
+# Otherwise returns None.
+def get_invariant_path(x, key):
+    if not isinstance(x, h5py.Group) or key.split("/")[-1] not in EPOCH_INVARIANT_KEYS:
+        return None
+    link = x.get(key, getlink=True)
+    if isinstance(link, h5py.SoftLink):
+        return link.path
+    ds = x[key]
+    if ds.attrs.get(EPOCH_INVARIANT_ATTR, False):
+        return ds.name
+    return None
+
+
+class InvariantArrayCache:
+    """
+    Reads each epoch invariant dataset once per file,
+    instead of once per epoch. Only the most recent file's arrays are kept.
+    The returned arrays are shared, so they must not be modified in place.
+    """
+
+    def __init__(self):
+        self.filename = None
+        self.arrays = {}
+
+    def read(self, x, key):
+        path = get_invariant_path(x, key)
+        if path is None:
+            return x[key][()]
+        if x.file.filename != self.filename:
+            self.filename = x.file.filename
+            self.arrays = {}
+        if path not in self.arrays:
+            self.arrays[path] = x[key][()]
+        return self.arrays[path]
+
+
+INVARIANT_ARRAYS = InvariantArrayCache()
+
+
+# Same as x[key][()], where x is an epoch group of features.hdf5,
+# or an in-memory epoch.
+def read_dataset(x, key):
+    return INVARIANT_ARRAYS.read(x, key)
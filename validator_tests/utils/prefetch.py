@@ -0,0 +1,89 @@
+import queue
+import threading
+
+from .utils import open_features, read_epoch_into_memory, read_exp_config_file
+
+
+class EpochPrefetcher:
+    """
+    Reads (and decompresses) epochs of features.hdf5 in a background thread,
+    so that the next epoch, or the next trial's first epoch,
+    is being read while the current one is scored.
+    At most max_queue_size epochs are held in memory at once.
+    Iterating yields ("epoch", folder, exp_config, epoch, epoch_data)
+    for every epoch, followed by ("end", folder) after each folder.
+    """
+
+    def __init__(self, exp_folders, max_queue_size=2):
+        self.exp_folders = exp_folders
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.read_all, daemon=True)
+
+    def put(self, x):
+        while not self.stop_event.is_set():
+            try:
+                self.queue.put(x, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read_all(self):
+        try:
+            for e in self.exp_folders:
+                exp_config = read_exp_config_file(e)
+                with open_features(e) as data:
+                    for k in data.keys():
+                        epoch_data = read_epoch_into_memory(data[k])
+                        if not self.put(("epoch", e, exp_config, k, epoch_data)):
+                            return
+                if not self.put(("end", e)):
+                    return
+            self.put(None)
+        except Exception as err:
+            self.put(err)
+
+    def __iter__(self):
+        self.thread.start()
+        try:
+            while True:
+                x = self.queue.get()
+                if x is None:
+                    return
+                if isinstance(x, Exception):
+                    raise x
+                yield x
+        finally:
+            self.close()
+
+    def close(self):
+        self.stop_event.set()
+        self.thread.join()
+
+
+# Same as utils.apply_to_data_multiple, but epochs are read by an EpochPrefetcher.
+# read_epoch_fn is applied to the in-memory epoch_data.
+def apply_to_data_prefetched(
+    exp_folders, conditions, fns, end_fns, max_queue_size=2, read_epoch_fn=None
+):
+    to_run = {}
+    for i, e in enumerate(exp_folders):
+        idx = [j for j, condition in enumerate(conditions) if condition(i, e)]
+        if len(idx) > 0:
+            to_run[e] = idx
+
+    curr_folder = None
+    for x in EpochPrefetcher(list(to_run.keys()), max_queue_size):
+        if x[0] == "end":
+            for j in to_run[x[1]]:
+                end_fns[j](x[1])
+            continue
+        _, e, exp_config, k, epoch_data = x
+        if e != curr_folder:
+            print(e)
+            curr_folder = e
+        if read_epoch_fn:
+            epoch_data = read_epoch_fn(epoch_data)
+        for j in to_run[e]:
+            fns[j](k, epoch_data, exp_config, e)
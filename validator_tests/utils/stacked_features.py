@@ -0,0 +1,157 @@
+import os
+
+import h5py
+import numpy as np
+
+from powerful_benchmarker.utils.feature_writer import EPOCH_INVARIANT_ATTR
+
+from .invariant_cache import get_invariant_path, read_dataset
+
+STACKED_FEATURES_FILENAME = "features_stacked.hdf5"
+
+
+def get_stacked_features_filepath(folder):
+    return os.path.join(folder, "features", STACKED_FEATURES_FILENAME)
+
+
+# Unlike visititems, this follows soft links,
+# like the ones that FeatureWriter creates for epoch invariant datasets.
+def get_dataset_names(x, prefix=""):
+    output = []
+    for k, v in x.items():
+        if isinstance(v, h5py.Group):
+            output.extend(get_dataset_names(v, f"{prefix}{k}/"))
+        else:
+            output.append(f"{prefix}{k}")
+    return output
+
+
+# Converts the <epoch>/<series>/<split>/<layer> layout of features.hdf5
+# into one dataset per <series>/<split>/<layer>, with a leading epoch axis.
+# The datasets are uncompressed and contiguous, so that they can be memory-mapped.
+# Datasets that are missing from some epochs, or whose shape changes
+# between epochs, are skipped and their names are returned.
+# Epoch invariant datasets that every epoch links to (e.g. labels)
+# are written once without the epoch axis, and marked with EPOCH_INVARIANT_ATTR.
+def convert_to_stacked(features_file, stacked_file):
+    with h5py.File(features_file, "r") as data:
+        epochs = list(data.keys())
+        names = {k: set(get_dataset_names(data[k])) for k in epochs}
+        common = set.intersection(*names.values()) if len(epochs) > 0 else set()
+        skipped = set.union(set(), *names.values()) - common
+        temp_file = f"{stacked_file}.tmp"
+        with h5py.File(temp_file, "w") as hf:
+            hf.attrs["epochs"] = epochs
+            for name in sorted(common):
+                first = data[f"{epochs[0]}/{name}"]
+                invariant_paths = {get_invariant_path(data[k], name) for k in epochs}
+                if len(invariant_paths) == 1 and None not in invariant_paths:
+                    ds = hf.create_dataset(name, data=first[()])
+                    ds.attrs[EPOCH_INVARIANT_ATTR] = True
+                    continue
+                if any(data[f"{k}/{name}"].shape != first.shape for k in epochs):
+                    skipped.add(name)
+                    continue
+                ds = hf.create_dataset(
+                    name, shape=(len(epochs), *first.shape), dtype=first.dtype
+                )
+                for i, k in enumerate(epochs):
+                    ds[i] = data[f"{k}/{name}"][()]
+        os.replace(temp_file, stacked_file)
+    return sorted(skipped)
+
+
+# The stacked file is out of date if features.hdf5 has different epochs,
+# e.g. because it was converted before the trial finished training.
+def is_stacked_up_to_date(stacked_file, features_file):
+    if not os.path.isfile(stacked_file):
+        return False
+    if not os.path.isfile(features_file):
+        return True
+    with h5py.File(stacked_file, "r") as hf:
+        stacked_epochs = [str(k) for k in hf.attrs["epochs"]]
+    with h5py.File(features_file, "r") as hf:
+        return stacked_epochs == list(hf.keys())
+
+
+def memmap_dataset(filepath, ds):
+    offset = ds.id.get_offset()
+    if offset is None or ds.size == 0:
+        # nothing was written, or the dataset isn't contiguous
+        return ds[()]
+    # copy-on-write, so that torch.from_numpy gets a writable array
+    # and the file is never modified
+    return np.memmap(filepath, dtype=ds.dtype, mode="c", offset=offset, shape=ds.shape)
+
+
+class StackedFeatures:
+    """
+    Memory-maps every dataset of a file written by convert_to_stacked.
+    keys() and __getitem__ mimic an h5py.File of the original layout:
+    x[epoch] is a flat dict like {"inference/src_train/logits": array},
+    where each array is a view of that epoch's slice of the file.
+    Epoch invariant datasets are shared by every epoch.
+    get_stacked returns the array of the given epochs, for cross-epoch scans.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        with h5py.File(filepath, "r") as hf:
+            self.epochs = [str(k) for k in hf.attrs["epochs"]]
+            self.arrays = {
+                name: memmap_dataset(filepath, hf[name])
+                for name in get_dataset_names(hf)
+            }
+            self.invariant = {
+                name
+                for name in self.arrays
+                if hf[name].attrs.get(EPOCH_INVARIANT_ATTR, False)
+            }
+        self.epoch_idx = {k: i for i, k in enumerate(self.epochs)}
+
+    def keys(self):
+        return self.epochs
+
+    def __getitem__(self, epoch):
+        i = self.epoch_idx[epoch]
+        return {
+            name: x if name in self.invariant else x[i]
+            for name, x in self.arrays.items()
+        }
+
+    def get_stacked(self, name, epochs):
+        x = self.arrays[name]
+        if name in self.invariant:
+            return np.repeat(x[None], len(epochs), axis=0)
+        return x[[self.epoch_idx[k] for k in epochs]]
+
+
+class StackedEpochs:
+    """
+    Stacks each dataset of the given epochs along a leading epoch axis,
+    e.g. x["inference/src_train/logits"] has shape (len(epochs), N, C).
+    data is an open features.hdf5 or a StackedFeatures.
+    Each dataset is read the first time it is accessed.
+    """
+
+    def __init__(self, data, epochs):
+        self.data = data
+        self.epochs = epochs
+        self.arrays = {}
+
+    def __getitem__(self, key):
+        if key not in self.arrays:
+            if isinstance(self.data, StackedFeatures):
+                self.arrays[key] = self.data.get_stacked(key, self.epochs)
+            else:
+                self.arrays[key] = np.stack(
+                    [read_dataset(self.data[k], key) for k in self.epochs]
+                )
+        return self.arrays[key]
+
+    def __contains__(self, key):
+        return key in self.data[self.epochs[0]]
+
+    # The unstacked data of one epoch
+    def get_epoch(self, epoch):
+        return self.data[epoch]
@@ -1,16 +1,36 @@
+import contextlib
 import glob
 import json
+import multiprocessing
 import os
+import pickle
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 
 import h5py
 import numpy as np
 import pandas as pd
+import torch
 import tqdm
 from pytorch_adapt.utils import common_functions as c_f
 
 from powerful_benchmarker.utils.constants import TRIALS_FILENAME
 
-from .constants import VALIDATOR_TESTS_FOLDER
+from .constants import PARTIAL_SCORES_FOLDER, VALIDATOR_TESTS_FOLDER
+from .invariant_cache import read_dataset
+from .stacked_features import (
+    StackedEpochs,
+    StackedFeatures,
+    get_dataset_names,
+    get_stacked_features_filepath,
+    is_stacked_up_to_date,
+)
+
+try:
+    # registers the blosc filters, for features saved with --feature_compression blosc_*
+    import hdf5plugin  # noqa: F401
+except ImportError:
+    pass
 
 
 def get_condition_fn(validator_name, validator_args_str, trial_range):
@@ -42,6 +62,58 @@ def get_df_filepath(folder, validator_name, validator_args_str):
     return f"{filename}.pkl"
 
 
+# Each epoch's score is saved here as soon as it is computed,
+# so that an interrupted trial can resume from the last scored epoch.
+# The folder is deleted once the trial's pkl file has been saved.
+# It is in a "partial" subfolder, so that it doesn't match the validator globs
+# of other scripts, like scripts/delete_DEV_folders.py.
+def get_partial_scores_folder(folder, validator_name, validator_args_str):
+    return os.path.join(
+        folder,
+        VALIDATOR_TESTS_FOLDER,
+        PARTIAL_SCORES_FOLDER,
+        validator_str(validator_name, validator_args_str),
+    )
+
+
+# Written by main.py --record_costs. Not a pkl, so collect_dfs.py ignores it.
+def get_costs_filepath(folder, validator_name, validator_args_str):
+    filename = get_df_filepath(folder, validator_name, validator_args_str)
+    return f"{filename[: -len('.pkl')]}.costs.csv"
+
+
+def save_partial_score(folder, validator_name, validator_args_str, epoch, x):
+    partial_folder = get_partial_scores_folder(
+        folder, validator_name, validator_args_str
+    )
+    c_f.makedir_if_not_there(partial_folder)
+    filepath = os.path.join(partial_folder, f"{epoch}.pkl")
+    with open(f"{filepath}.tmp", "wb") as f:
+        pickle.dump(x, f)
+    os.replace(f"{filepath}.tmp", filepath)
+
+
+def load_partial_score(folder, validator_name, validator_args_str, epoch):
+    partial_folder = get_partial_scores_folder(
+        folder, validator_name, validator_args_str
+    )
+    filepath = os.path.join(partial_folder, f"{epoch}.pkl")
+    if not os.path.isfile(filepath):
+        return None
+    try:
+        with open(filepath, "rb") as f:
+            return pickle.load(f)
+    except:  # in case it's corrupted or something
+        return None
+
+
+def delete_partial_scores(folder, validator_name, validator_args_str):
+    partial_folder = get_partial_scores_folder(
+        folder, validator_name, validator_args_str
+    )
+    shutil.rmtree(partial_folder, ignore_errors=True)
+
+
 def dict_to_str(x):
     return json.dumps(x, sort_keys=True)
 
@@ -66,6 +138,26 @@ def read_exp_config_file(folder):
     return exp_config
 
 
+def get_features_filepath(folder):
+    return os.path.join(folder, "features", "features.hdf5")
+
+
+# Uses the memory-mapped stacked layout if it has been created
+# by convert_features.py and has the same epochs as features.hdf5,
+# otherwise the original features.hdf5.
+@contextlib.contextmanager
+def open_features(folder):
+    features_file = get_features_filepath(folder)
+    stacked_file = get_stacked_features_filepath(folder)
+    if is_stacked_up_to_date(stacked_file, features_file):
+        yield StackedFeatures(stacked_file)
+    else:
+        if os.path.isfile(stacked_file):
+            c_f.LOGGER.warning(f"{stacked_file} is out of date, using {features_file}")
+        with h5py.File(features_file, "r") as data:
+            yield data
+
+
 def apply_to_data(exp_folders, condition, fn=None, end_fn=None):
     for i, e in enumerate(exp_folders):
         if not condition(i, e):
@@ -73,14 +165,157 @@ def apply_to_data(exp_folders, condition, fn=None, end_fn=None):
         if fn:
             print(e)
             exp_config = read_exp_config_file(e)
-            features_file = os.path.join(e, "features", "features.hdf5")
-            with h5py.File(features_file, "r") as data:
+            with open_features(e) as data:
                 for k in tqdm.tqdm(data.keys()):
                     fn(k, data[k], exp_config, e)
         if end_fn:
             end_fn(e)
 
 
+# Reads every dataset under the given series into a flat dict,
+# e.g. {"inference/src_train/logits": np.ndarray}.
+# Indexing with x[key][()] works the same as with the h5py group.
+def read_epoch_into_memory(x, series_names=("inference",)):
+    if isinstance(x, dict):
+        # an epoch of StackedFeatures
+        return {k: np.array(v) for k, v in x.items() if k.split("/")[0] in series_names}
+    output = {}
+    for series_name in series_names:
+        if series_name in x:
+            for name in get_dataset_names(x[series_name]):
+                name = f"{series_name}/{name}"
+                output[name] = read_dataset(x, name)
+    return output
+
+
+# Like apply_to_data, but each epoch is read once
+# and then passed to every fn whose condition is True.
+def apply_to_data_multiple(
+    exp_folders, conditions, fns, end_fns, read_epoch_fn=read_epoch_into_memory
+):
+    for i, e in enumerate(exp_folders):
+        idx = [j for j, condition in enumerate(conditions) if condition(i, e)]
+        if len(idx) == 0:
+            continue
+        print(e)
+        exp_config = read_exp_config_file(e)
+        with open_features(e) as data:
+            for k in tqdm.tqdm(data.keys()):
+                epoch_data = read_epoch_fn(data[k])
+                for j in idx:
+                    fns[j](k, epoch_data, exp_config, e)
+        for j in idx:
+            end_fns[j](e)
+
+
+# Like apply_to_data_multiple, but each fn is called once per group of
+# up to epoch_batch_size epochs: fn(epochs, data, exp_config, folder),
+# where data is read_epochs_fn(StackedEpochs(...)).
+def apply_to_data_batched(
+    exp_folders, conditions, fns, end_fns, epoch_batch_size, read_epochs_fn=None
+):
+    for i, e in enumerate(exp_folders):
+        idx = [j for j, condition in enumerate(conditions) if condition(i, e)]
+        if len(idx) == 0:
+            continue
+        print(e)
+        exp_config = read_exp_config_file(e)
+        with open_features(e) as data:
+            epochs = list(data.keys())
+            for s in range(0, len(epochs), epoch_batch_size):
+                curr_epochs = epochs[s : s + epoch_batch_size]
+                epoch_data = StackedEpochs(data, curr_epochs)
+                if read_epochs_fn:
+                    epoch_data = read_epochs_fn(epoch_data)
+                for j in idx:
+                    fns[j](curr_epochs, epoch_data, exp_config, e)
+        for j in idx:
+            end_fns[j](e)
+
+
+# set in each worker process by init_parallel_worker
+PARALLEL_WORKER_STATE = {}
+
+
+def init_parallel_worker(fns, read_epoch_fn, torch_threads):
+    torch.set_num_threads(torch_threads)
+    PARALLEL_WORKER_STATE.update({"fns": fns, "read_epoch_fn": read_epoch_fn})
+
+
+def parallel_worker(folder, epoch, idx):
+    fns = PARALLEL_WORKER_STATE["fns"]
+    read_epoch_fn = PARALLEL_WORKER_STATE["read_epoch_fn"]
+    exp_config = read_exp_config_file(folder)
+    with open_features(folder) as data:
+        epoch_data = read_epoch_fn(data[epoch])
+        return [fns[j](epoch, epoch_data, exp_config, folder) for j in idx]
+
+
+def get_epochs(folder):
+    with open_features(folder) as data:
+        return list(data.keys())
+
+
+def get_torch_threads(num_workers, torch_threads):
+    max_threads = max(1, (os.cpu_count() or 1) // num_workers)
+    if torch_threads > max_threads:
+        c_f.LOGGER.warning(
+            f"Reducing torch_threads from {torch_threads} to {max_threads}, "
+            f"so that {num_workers} workers don't use more than {os.cpu_count()} cores"
+        )
+        return max_threads
+    return torch_threads
+
+
+# Like apply_to_data_multiple, but every (folder, epoch) pair is scored
+# in a pool of worker processes. Each fn must return its result instead of
+# storing it. The results are passed to collect_fns in the main process,
+# in the same order as apply_to_data_multiple, and then end_fns are called.
+# Uses fork, so that the fns don't need to be picklable.
+# CUDA can't be used in forked processes once the parent has initialized it,
+# so this raises an error if it has.
+# Each worker uses torch_threads threads, which is reduced if needed
+# so that num_workers * torch_threads is at most the number of CPU cores.
+def apply_to_data_parallel(
+    exp_folders,
+    conditions,
+    fns,
+    collect_fns,
+    end_fns,
+    num_workers,
+    torch_threads=1,
+    read_epoch_fn=read_epoch_into_memory,
+):
+    if torch.cuda.is_initialized():
+        raise RuntimeError(
+            "CUDA has been initialized, so it can't be used in forked worker processes"
+        )
+    torch_threads = get_torch_threads(num_workers, torch_threads)
+    to_run = []
+    for i, e in enumerate(exp_folders):
+        idx = [j for j, condition in enumerate(conditions) if condition(i, e)]
+        if len(idx) > 0:
+            to_run.append((e, idx))
+
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        mp_context=multiprocessing.get_context("fork"),
+        initializer=init_parallel_worker,
+        initargs=(fns, read_epoch_fn, torch_threads),
+    ) as executor:
+        futures = [
+            [executor.submit(parallel_worker, e, k, idx) for k in get_epochs(e)]
+            for e, idx in to_run
+        ]
+        for (e, idx), curr_futures in zip(to_run, futures):
+            print(e)
+            for f in curr_futures:
+                for j, result in zip(idx, f.result()):
+                    collect_fns[j](result)
+            for j in idx:
+                end_fns[j](e)
+
+
 # str representation of dict as input
 def validator_args_delimited(validator_args_str, delimiter="_"):
     return delimiter.join(
@@ -59,3 +59,4 @@ if __name__ == "__main__":
 # (1, feature_size). Since self-distances are excluded, the denominator
 # used for normalization is 0. See denom calculation in
 # pytorch_adapt.layers.utils.get_mmd_quadratic_batched
+# MMDPerClass and MMDPerClassFixedB now skip these classes (see get_per_class_scores)